@@ -2,7 +2,7 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from flask import Flask, render_template, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 
 load_dotenv()
@@ -11,14 +11,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 PUBLIC = BASE_DIR / "public"
 
 def create_app():
-    app = Flask(
-        __name__,
-        static_folder=str(PUBLIC),
-        template_folder=str(PUBLIC),
-        static_url_path=""
-    )
+    # Sin ruta static de Flask: public/ lo sirve app/assets.py
+    app = Flask(__name__, static_folder=None)
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-key")
 
+    # Detrás de Render/nginx: remote_addr real para los límites por IP
+    trusted = int(os.getenv("TRUSTED_PROXIES", "0"))
+    if trusted:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted, x_proto=trusted)
+
+    # JSON rápido (orjson si está) + compresión br/gzip de respuestas grandes
+    from .fastjson import FastJSONProvider
+    from .compress import init_compression
+    app.json = FastJSONProvider(app)
+    init_compression(app)
+
     CORS(
         app,
         resources={
@@ -40,43 +48,39 @@ def create_app():
     app.register_blueprint(survey.bp)  # /api/survey/...
     app.register_blueprint(admin.bp)   # /api/admin/...
 
-    # Páginas estáticas útiles en local
-    @app.get("/")
-    def home():
-        return render_template("index.html")
-
-    @app.get("/register")
-    @app.get("/register.html")
-    def register_page():
-        return render_template("register.html")
+    # CLI: flask --app wsgi import-scas archivo.jsonl
+    from .bulk import import_scas_command
+    from .archive import archive_command, rehydrate_command
+    from .snapshot import snapshot_command, start_background_sync
+    app.cli.add_command(import_scas_command)
+    app.cli.add_command(archive_command)      # archive-responses --older-than-days 365
+    app.cli.add_command(rehydrate_command)    # rehydrate-responses 2024-03
+    app.cli.add_command(snapshot_command)     # snapshot-sync [--rebuild]
+    from .tenants import create_tenant_command, tenant_join_code_command
+    app.cli.add_command(create_tenant_command)  # create-tenant CODIGO "Nombre" [--db-url URL]
+    app.cli.add_command(tenant_join_code_command)  # tenant-join-code CODIGO [--join-code X]
 
-    @app.get("/student")
-    @app.get("/student.html")
-    def student_page():
-        return render_template("student.html")
-
-    @app.get("/results")
-    @app.get("/results.html")
-    def results_page():
-        return render_template("results.html")
-
-    @app.get("/admin")
-    @app.get("/admin.html")
-    def admin_page():
-        return render_template("admin.html")
-
-    @app.get("/<path:filename>")
-    def public_files(filename):
-        return send_from_directory(PUBLIC, filename)
+    # Páginas y archivos de public/: en memoria, con huella y precomprimidos
+    from .assets import init_assets
+    init_assets(app, PUBLIC)
 
     # Inicialización DB/seed
-    from .db import create_database_if_needed, create_tables_if_needed, ensure_admin
+    from .db import (create_database_if_needed, create_tables_if_needed, ensure_admin,
+                     backfill_response_scores, use_primary)
     from .seed.seed_scas import run_seed
-    with app.app_context():
+    from .tenants import migrate_tenant_databases
+    with app.app_context(), use_primary():
         create_database_if_needed()
         create_tables_if_needed()
         ensure_admin()
         run_seed()
+        backfill_response_scores()
+        migrate_tenant_databases()  # colegios con base propia
+
+    # Sync periódico del snapshot columnar (opcional; si no, cron con snapshot-sync)
+    interval = float(os.getenv("SNAPSHOT_SYNC_INTERVAL", "0"))
+    if interval > 0:
+        start_background_sync(interval)
 
     print(app.url_map)
     return app
@@ -1,39 +1,50 @@
 # app/admin.py
 from __future__ import annotations
 
-from flask import Blueprint, jsonify
-from .db import db_all, db_one
-from .utils import require_auth, level_from_score
+import io
+import os
+import time
+from typing import Optional
 
-bp = Blueprint("admin", __name__, url_prefix="/api/admin")
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from . import analytics, history, metrics, neighbors, search
+from .cache import TTLCache
+from .db import db_all, db_one, pool_status
+from .events import broker, format_sse, publish_resync
+from .offload import gevent_active
+from .statements import profile as statement_profile, statement
+from .tenancy import DEFAULT_TENANT, current_tenant
+from .users import get_user
+from .utils import STREAM_TOKEN_SECONDS, level_from_score, make_stream_token, require_auth
 
+bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
-def _survey_id():
-    s = db_one("SELECT id FROM surveys WHERE code='SCAS_CHILD'")
-    return s["id"] if s else None
 
+# Sentencias del panel (registradas una vez, ver app/statements.py)
+_SURVEY_ID = statement("admin.survey_id", "SELECT id FROM surveys WHERE code='SCAS_CHILD'")
 
-def _students_rows(sid: int):
-    # “last”: último intento por alumno; “agg”: total de intentos por alumno
-    sql = """
+# Todo filtrado por colegio (:tid), con índices que empiezan por tenant_id.
+# “last”: último intento por alumno; “agg”: total de intentos por alumno
+_STUDENTS = statement("admin.students", """
     WITH last AS (
         SELECT r.user_id, r.total_score, r.created_at
         FROM responses r
         JOIN (
             SELECT user_id, MAX(created_at) AS last_dt
             FROM responses
-            WHERE survey_id=:sid
+            WHERE tenant_id=:tid AND survey_id=:sid
             GROUP BY user_id
         ) t ON t.user_id = r.user_id AND t.last_dt = r.created_at
-        WHERE r.survey_id=:sid
+        WHERE r.tenant_id=:tid AND r.survey_id=:sid
     ),
     agg AS (
         SELECT user_id, COUNT(*) AS attempts
         FROM responses
-        WHERE survey_id=:sid
+        WHERE tenant_id=:tid AND survey_id=:sid
         GROUP BY user_id
     )
     SELECT
+        u.id,
         u.fullname,
         u.email,
         COALESCE(a.attempts, 0)        AS attempts,
@@ -42,13 +53,70 @@ def _students_rows(sid: int):
     FROM users u
     LEFT JOIN agg a  ON a.user_id = u.id
     LEFT JOIN last l ON l.user_id = u.id
-    WHERE
+    WHERE u.tenant_id=:tid AND (
         u.role = 'student' OR
-        u.id IN (SELECT DISTINCT user_id FROM responses WHERE survey_id=:sid)
+        u.id IN (SELECT DISTINCT user_id FROM responses WHERE tenant_id=:tid AND survey_id=:sid)
+    )
     ORDER BY COALESCE(l.created_at, TIMESTAMP('1970-01-01 00:00:00')) DESC,
              u.fullname ASC
-    """
-    rows = db_all(sql, {"sid": sid})
+""")
+
+# Alumnos = distintos usuarios que han respondido o que tienen role student
+_STUDENT_COUNT = statement("admin.student_count", """
+    SELECT
+      (
+        SELECT COUNT(*) FROM users WHERE tenant_id=:tid AND role='student'
+      ) +
+      (
+        SELECT COUNT(*) FROM (
+          SELECT DISTINCT user_id
+          FROM responses WHERE tenant_id=:tid AND survey_id=:sid
+        ) z
+      ) -
+      (
+        SELECT COUNT(*) FROM users u
+        WHERE u.tenant_id=:tid AND u.role='student' AND u.id IN (
+          SELECT DISTINCT user_id FROM responses WHERE tenant_id=:tid AND survey_id=:sid
+        )
+      ) AS c
+""")
+
+_ATTEMPT_COUNT = statement(
+    "admin.attempt_count",
+    "SELECT COUNT(*) AS c FROM responses WHERE tenant_id=:tid AND survey_id=:sid",
+)
+
+_AVG_LAST = statement("admin.avg_last", """
+    WITH last AS (
+      SELECT r.user_id, r.total_score
+      FROM responses r
+      JOIN (
+        SELECT user_id, MAX(created_at) AS last_dt
+        FROM responses
+        WHERE tenant_id=:tid AND survey_id=:sid
+        GROUP BY user_id
+      ) t ON t.user_id=r.user_id AND t.last_dt=r.created_at
+      WHERE r.tenant_id=:tid AND r.survey_id=:sid
+    )
+    SELECT ROUND(AVG(total_score),0) AS avg_last FROM last
+""")
+
+# Lista + tarjetas del panel por colegio; cada envío invalida la de su colegio
+PANEL_CACHE_TTL = float(os.getenv("PANEL_CACHE_TTL", "10"))
+_panel = TTLCache(maxsize=1024, ttl=PANEL_CACHE_TTL)
+
+
+def invalidate_panel(tid: Optional[int] = None) -> None:
+    _panel.pop(current_tenant() if tid is None else tid)
+
+
+def _survey_id():
+    s = db_one(_SURVEY_ID)
+    return s["id"] if s else None
+
+
+def _students_rows(sid: int, tid: int):
+    rows = db_all(_STUDENTS, {"sid": sid, "tid": tid})
     out = []
     for r in rows:
         d = dict(r)
@@ -59,65 +127,224 @@ def _students_rows(sid: int):
     return out
 
 
-def _stats(sid: int):
-    # Alumnos = distintos usuarios que han respondido o que tienen role student
-    students = db_one(
-        """
-        SELECT
-          (
-            SELECT COUNT(*) FROM users WHERE role='student'
-          ) +
-          (
-            SELECT COUNT(*) FROM (
-              SELECT DISTINCT user_id
-              FROM responses WHERE survey_id=:sid
-            ) z
-          ) -
-          (
-            SELECT COUNT(*) FROM users u
-            WHERE u.role='student' AND u.id IN (
-              SELECT DISTINCT user_id FROM responses WHERE survey_id=:sid
-            )
-          ) AS c
-        """,
-        {"sid": sid},
-    )["c"] or 0
-
-    attempts = db_one(
-        "SELECT COUNT(*) AS c FROM responses WHERE survey_id=:sid", {"sid": sid}
-    )["c"] or 0
-
-    avg_last = db_one(
-        """
-        WITH last AS (
-          SELECT r.user_id, r.total_score
-          FROM responses r
-          JOIN (
-            SELECT user_id, MAX(created_at) AS last_dt
-            FROM responses
-            WHERE survey_id=:sid
-            GROUP BY user_id
-          ) t ON t.user_id=r.user_id AND t.last_dt=r.created_at
-          WHERE r.survey_id=:sid
-        )
-        SELECT ROUND(AVG(total_score),0) AS avg_last FROM last
-        """,
-        {"sid": sid},
-    )["avg_last"] or 0
+def _stats(sid: int, tid: int):
+    p = {"sid": sid, "tid": tid}
+    students = db_one(_STUDENT_COUNT, p)["c"] or 0
+    attempts = db_one(_ATTEMPT_COUNT, p)["c"] or 0
+    avg_last = db_one(_AVG_LAST, p)["avg_last"] or 0
 
     return {"students": students, "attempts": attempts, "avg_last": avg_last}
 
 
+def _panel_data():
+    sid = _survey_id()
+    if not sid:
+        return {"students": [], "stats": {"students": 0, "attempts": 0, "avg_last": 0}}
+    tid = current_tenant()
+    return {"students": _students_rows(sid, tid), "stats": _stats(sid, tid)}
+
+
+def _own_student(uid: int) -> bool:
+    """El alumno existe y es del colegio del admin."""
+    u = get_user(uid)
+    return bool(u) and u.get("tenant_id", DEFAULT_TENANT) == current_tenant()
+
+
 @bp.get("/students")
 @bp.get("/students/")
 @require_auth(role="admin")
 def students():
-    sid = _survey_id()
-    if not sid:
-        return jsonify({"students": [], "stats": {"students": 0, "attempts": 0, "avg_last": 0}})
     try:
-        rows = _students_rows(sid)
-        return jsonify({"students": rows, "stats": _stats(sid)})
+        return jsonify(_panel.get_or_set(current_tenant(), _panel_data))
     except Exception as e:
         print("[ADMIN /students] error:", e)
         return jsonify({"error": "Error al obtener estudiantes"}), 500
+
+
+@bp.get("/search")
+@require_auth(role="admin")
+def search_students():
+    """Busca estudiantes por nombre o correo (sin acentos). ?q=texto&limit=20"""
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit") or 20), 100))
+    except ValueError:
+        return jsonify({"error": "limit debe ser un entero"}), 400
+    if not q:
+        return jsonify({"results": []})
+    try:
+        return jsonify({"results": search.for_tenant().search(q, limit)})
+    except Exception as e:
+        print("[ADMIN /search] error:", e)
+        return jsonify({"error": "Error al buscar"}), 500
+
+
+@bp.get("/students/<int:uid>/history")
+@require_auth(role="admin")
+def student_history(uid: int):
+    """Intentos de un alumno con tendencia. ?before=<id>&limit=N"""
+    try:
+        before, limit = history.page_args(request.args)
+    except ValueError:
+        return jsonify({"error": "before y limit deben ser enteros"}), 400
+    if not _own_student(uid):
+        return jsonify({"error": "Estudiante no encontrado"}), 404
+    try:
+        return jsonify(history.page(uid, before, limit))
+    except Exception as e:
+        print("[ADMIN /history] error:", e)
+        return jsonify({"error": "Error al obtener historial"}), 500
+
+
+@bp.get("/students/<int:uid>/similar")
+@require_auth(role="admin")
+def student_similar(uid: int):
+    """
+    Alumnos con el perfil de subescalas (último intento) más parecido.
+    ?k=10  ?method=index|brute (brute: comparación exhaustiva, para validar)
+    """
+    method = request.args.get("method", "index")
+    if method not in ("index", "brute"):
+        return jsonify({"error": "method debe ser index o brute"}), 400
+    try:
+        k = max(1, min(int(request.args.get("k") or 10), 100))
+    except ValueError:
+        return jsonify({"error": "k debe ser un entero"}), 400
+    try:
+        t0 = time.perf_counter()
+        index = neighbors.for_tenant()
+        found = (index.brute if method == "brute" else index.similar)(uid, k)
+        elapsed = time.perf_counter() - t0
+    except Exception as e:
+        print("[ADMIN /similar] error:", e)
+        return jsonify({"error": "Error al buscar perfiles similares"}), 500
+    if found is None:
+        return jsonify({"error": "El estudiante no tiene intentos"}), 404
+
+    out = []
+    for other, dist in found:
+        u = get_user(other) or {}
+        out.append({"user_id": other, "fullname": u.get("fullname"),
+                    "email": u.get("email"), "distance": round(dist, 4)})
+    return jsonify({"user_id": uid, "method": method, "k": k,
+                    "elapsed_ms": round(elapsed * 1000, 3), "neighbors": out})
+
+
+@bp.post("/import")
+@require_auth(role="admin")
+def import_attempts():
+    """
+    Importa intentos offline en bloque. Acepta un archivo multipart (`file`)
+    o el cuerpo crudo (text/csv o application/x-ndjson). `?dry_run=1` solo valida.
+    """
+    from .bulk import detect_format, import_attempts as run_import, parse_records
+
+    dry_run = request.args.get("dry_run") in ("1", "true", "yes")
+    up = request.files.get("file")
+    if up:
+        fmt = request.args.get("format") or detect_format(up.filename, up.mimetype)
+        stream = io.TextIOWrapper(up.stream, encoding="utf-8-sig", newline="")
+    else:
+        body = request.get_data(as_text=True)
+        if not body.strip():
+            return jsonify({"error": "Archivo vacío"}), 400
+        fmt = request.args.get("format") or detect_format(None, request.content_type)
+        stream = io.StringIO(body.lstrip("\ufeff"), newline="")
+
+    if fmt not in ("jsonl", "csv"):
+        return jsonify({"error": "Formato no soportado (usa jsonl o csv)"}), 400
+    try:
+        report = run_import(parse_records(stream, fmt), dry_run=dry_run,
+                            tenant=current_tenant())
+    except Exception as e:
+        print("[ADMIN /import] error:", e)
+        return jsonify({"error": "Error al importar intentos"}), 500
+    if report["imported"]:
+        publish_resync(current_tenant())
+    return jsonify(report)
+
+
+@bp.get("/analytics")
+@require_auth(role="admin")
+def analytics_view():
+    """
+    Distribución poblacional de total y subescalas.
+    ?gender=M|F  ?age=N  ?scope=latest|all (último intento por alumno o todos)
+    ?ranks=0 omite el percentil por alumno.
+    """
+    gender = (request.args.get("gender") or "").upper() or None
+    scope = request.args.get("scope", "latest")
+    age = request.args.get("age")
+    if gender not in (None, "M", "F"):
+        return jsonify({"error": "gender debe ser M o F"}), 400
+    if scope not in ("latest", "all"):
+        return jsonify({"error": "scope debe ser latest o all"}), 400
+    try:
+        age = int(age) if age else None
+    except ValueError:
+        return jsonify({"error": "age debe ser un entero"}), 400
+    ranks = request.args.get("ranks", "1") not in ("0", "false", "no")
+    try:
+        return jsonify(analytics.population(gender, age, scope, ranks))
+    except Exception as e:
+        print("[ADMIN /analytics] error:", e)
+        return jsonify({"error": "Error al calcular analítica"}), 500
+
+
+# El stream tiene el request abierto minutos: solo bajo gevent (un greenlet).
+# En modo sync ocuparía un worker entero, así que el panel consulta /students
+# cada STREAM_POLL_SECONDS en su lugar.
+STREAM_PING_SECONDS = 15   # comentario keep-alive para proxies
+STREAM_MAX_SECONDS = 300   # cierra y deja que EventSource reconecte
+STREAM_POLL_SECONDS = int(os.getenv("STREAM_POLL_SECONDS", "30"))
+
+
+@bp.post("/stream-token")
+@require_auth(role="admin")
+def stream_token():
+    """Token corto para abrir /stream (EventSource lo manda en la URL), o `live: false`."""
+    if not gevent_active():
+        return jsonify({"live": False, "poll_seconds": STREAM_POLL_SECONDS})
+    return jsonify({"live": True, "token": make_stream_token(request.user),
+                    "expires_in": STREAM_TOKEN_SECONDS})
+
+
+@bp.get("/stream")
+@require_auth(role="admin", query_token=True)
+def stream():
+    """Server-sent events con deltas de intentos nuevos para el panel."""
+    if not gevent_active():
+        resp = jsonify({"error": "Stream no disponible en modo sync"})
+        resp.headers["Retry-After"] = str(STREAM_POLL_SECONDS)
+        return resp, 503
+    sub = broker.subscribe(current_tenant())
+
+    def gen():
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                event = sub.get(timeout=STREAM_PING_SECONDS)
+                yield format_sse(event) if event else ": ping\n\n"
+        finally:
+            broker.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(gen()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.get("/metrics")
+@require_auth(role="admin")
+def metrics_view():
+    """
+    Métricas del proceso que atiende (límites, consultas por engine y sentencia,
+    pools). Son de todos los colegios, así que solo las ve un admin del colegio
+    principal (el que opera el servidor).
+    """
+    if current_tenant() != DEFAULT_TENANT:
+        return jsonify({"error": "No autorizado"}), 403
+    return jsonify({**metrics.snapshot(), "db_pools": pool_status(),
+                    "statements": statement_profile()})
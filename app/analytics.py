@@ -0,0 +1,181 @@
+# app/analytics.py
+"""
+Analítica poblacional de SCAS con NumPy vectorizado.
+
+Fuente: el snapshot columnar (app/snapshot.py) más las respuestas posteriores
+a su marca de agua; sin snapshot, una sola consulta de columnas planas.
+Por cada combinación de filtros (género, edad, alcance) se calcula en una
+pasada: histogramas, percentiles y prevalencia de niveles del total y las
+seis subescalas, cortes por género y edad, y el percentil de cada alumno.
+El resultado se cachea por colegio y filtro, y se invalida con cada envío
+nuevo del mismo colegio. Un colegio con base propia no usa el snapshot
+(que es de la base principal) sino la consulta directa.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .cache import TTLCache
+from .db import db_all, tenant_routed
+from .snapshot import COLUMNS, open_snapshot_meta
+from .statements import statement
+from .tenancy import current_tenant
+
+SCALES = ["total", "gad", "soc", "ocd", "paa", "phb", "sad"]
+# Puntaje máximo: 3 x ítems puntuables de cada escala
+SCALE_MAX = {"total": 114, "gad": 18, "soc": 18, "ocd": 18, "paa": 27, "phb": 15, "sad": 18}
+TOTAL_BIN = 6  # ancho de barra del histograma del total
+PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+LEVELS = ["Leve", "Moderado", "Grave"]  # mismas bandas que level_from_score
+LEVEL_EDGES = [38, 76]
+GENDERS = {0: None, 1: "M", 2: "F"}
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+_caches: Dict[int, TTLCache] = {}  # un caché por colegio
+_caches_lock = threading.Lock()
+
+_SELECT = statement("analytics.tail", """
+    SELECT r.id AS response_id, r.user_id, UNIX_TIMESTAMP(r.created_at) AS ts,
+           r.total_score AS total, r.gad, r.soc, r.ocd, r.paa, r.phb, r.sad
+    FROM responses r
+    JOIN surveys s ON s.id = r.survey_id AND s.code='SCAS_CHILD'
+    WHERE r.tenant_id = :t AND r.id > :hwm AND r.gad IS NOT NULL
+    ORDER BY r.id
+""")
+_USERS = statement("analytics.user_attrs", "SELECT id, gender, age FROM users WHERE tenant_id=:t")
+
+
+def _cache_for(tid: int) -> TTLCache:
+    with _caches_lock:
+        c = _caches.get(tid)
+        if c is None:
+            c = _caches[tid] = TTLCache(maxsize=64, ttl=ANALYTICS_CACHE_TTL)
+        return c
+
+
+def invalidate(tid: Optional[int] = None) -> None:
+    """Llamar tras cada envío/importación: descarta lo cacheado del colegio."""
+    _cache_for(current_tenant() if tid is None else tid).clear()
+
+
+def _rows_to_columns(rows) -> Dict[str, np.ndarray]:
+    return {
+        col: np.fromiter((int(r[col] or 0) for r in rows), dtype=dt, count=len(rows))
+        for col, dt in COLUMNS.items()
+    }
+
+
+def load_columns() -> Dict[str, np.ndarray]:
+    """
+    Snapshot + cola reciente del colegio (o todo desde la BD si no hay
+    snapshot). El snapshot trae todos los colegios: filtrar con user_attrs.
+    """
+    snap, meta = (None, None) if tenant_routed() else open_snapshot_meta()
+    hwm = meta["hwm"] if snap is not None else 0
+    tail = _rows_to_columns(db_all(_SELECT, {"t": current_tenant(), "hwm": hwm}))
+    if snap is None:
+        return tail
+    return {c: np.concatenate([snap[c], tail[c]]) for c in COLUMNS}
+
+
+def user_attrs(user_ids: np.ndarray):
+    """
+    Por fila: pertenece al colegio en curso, género (0 sin dato, 1 M, 2 F) y
+    edad (0 sin dato), vía tablas indexadas por id de usuario.
+    """
+    rows = db_all(_USERS, {"t": current_tenant()})
+    size = max([r["id"] for r in rows] + [int(user_ids.max(initial=0))]) + 1
+    member = np.zeros(size, dtype=bool)
+    gender = np.zeros(size, dtype=np.int8)
+    age = np.zeros(size, dtype=np.int16)
+    for r in rows:
+        member[r["id"]] = True
+        gender[r["id"]] = 1 if r["gender"] == "M" else 2 if r["gender"] == "F" else 0
+        age[r["id"]] = r["age"] or 0
+    return member[user_ids], gender[user_ids], age[user_ids]
+
+
+def latest_mask(user_id: np.ndarray, ts: np.ndarray, rid: np.ndarray) -> np.ndarray:
+    """Máscara con el último intento de cada alumno."""
+    order = np.lexsort((rid, ts, user_id))
+    u = user_id[order]
+    last = np.ones(len(u), dtype=bool)
+    last[:-1] = u[1:] != u[:-1]
+    mask = np.zeros(len(u), dtype=bool)
+    mask[order[last]] = True
+    return mask
+
+
+def _summary(M: np.ndarray) -> Dict[str, Any]:
+    """M: (n, 7) con columnas SCALES. Todo vectorizado por columna."""
+    n = len(M)
+    out: Dict[str, Any] = {"n": n}
+    if not n:
+        return out
+    pct = np.percentile(M, PERCENTILES, axis=0)
+    mean = M.mean(axis=0)
+    scales = {}
+    for j, name in enumerate(SCALES):
+        width = TOTAL_BIN if name == "total" else 1
+        counts = np.bincount(M[:, j] // width, minlength=SCALE_MAX[name] // width + 1)
+        scales[name] = {
+            "mean": round(float(mean[j]), 2),
+            "percentiles": {str(p): float(pct[i, j]) for i, p in enumerate(PERCENTILES)},
+            "histogram": {"bin_width": width, "counts": counts.tolist()},
+        }
+    levels = np.bincount(np.digitize(M[:, 0], LEVEL_EDGES), minlength=3)
+    out["scales"] = scales
+    out["levels"] = {
+        LEVELS[i]: {"count": int(levels[i]), "share": round(float(levels[i]) / n, 4)}
+        for i in range(3)
+    }
+    return out
+
+
+def compute(gender: Optional[str] = None, age: Optional[int] = None,
+            scope: str = "latest", ranks: bool = True) -> Dict[str, Any]:
+    cols = load_columns()
+    uid = cols["user_id"].astype(np.int64)
+    mask, g, a = user_attrs(uid)
+    if gender:
+        mask &= g == (1 if gender == "M" else 2)
+    if age:
+        mask &= a == age
+    if scope == "latest":
+        # Género y edad son por alumno: da igual filtrar antes o después
+        mask &= latest_mask(uid, cols["ts"], cols["response_id"])
+
+    M = np.column_stack([cols[s][mask] for s in SCALES]).astype(np.int64)
+    g, a, u = g[mask], a[mask], uid[mask]
+    ts, rid = cols["ts"][mask], cols["response_id"][mask]
+
+    out: Dict[str, Any] = {
+        "filters": {"gender": gender, "age": age, "scope": scope},
+        "overall": _summary(M),
+        "by_gender": {GENDERS[k]: _summary(M[g == k]) for k in (1, 2) if (g == k).any()},
+        "by_age": {int(k): _summary(M[a == k]) for k in np.unique(a) if k},
+    }
+
+    if ranks:
+        # Percentil de cada alumno según su último intento dentro del filtro
+        last = latest_mask(u, ts, rid)
+        lu, lt = u[last], M[last, 0]
+        srt = np.sort(lt)
+        pr = np.searchsorted(srt, lt, side="right") / max(len(srt), 1) * 100
+        out["ranks"] = {
+            "user_id": lu.tolist(),
+            "total": lt.tolist(),
+            "percentile": np.round(pr, 1).tolist(),
+        }
+    return out
+
+
+def population(gender: Optional[str] = None, age: Optional[int] = None,
+               scope: str = "latest", ranks: bool = True) -> Dict[str, Any]:
+    """compute() cacheado por colegio y combinación de filtros."""
+    key = (gender, age, scope, ranks)
+    return _cache_for(current_tenant()).get_or_set(key, lambda: compute(gender, age, scope, ranks))
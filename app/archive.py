@@ -0,0 +1,228 @@
+# app/archive.py
+"""
+Archivado en frío del detalle por ítem (response_items).
+
+Las respuestas más antiguas que ARCHIVE_AFTER_DAYS (o --older-than-days)
+mueven sus 44 filas de detalle a un archivo mensual comprimido
+ARCHIVE_DIR/response_items-YYYY-MM.jsonl.gz, una línea por respuesta:
+
+    {"response_id": 1, "user_id": 7, "survey_id": 1,
+     "created_at": "2024-03-05T10:00:00", "answers": {"1": 2, ..., "44": 0}}
+
+Lo mismo vale para los intentos guardados empaquetados (answers_packed se
+archiva desempaquetado y se limpia). La cabecera en `responses` (total,
+subescalas) se queda online y se marca con `archived_at`, así el panel, el modelo y los agregados no cambian.
+Para investigación: `iter_archived()` recorre los archivos y
+`rehydrate(mes)` vuelve a cargar un mes a response_items.
+
+(Particionar response_items por mes en MySQL no es opción mientras tenga
+claves foráneas: InnoDB no admite FKs en tablas particionadas.)
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import click
+from sqlalchemy import bindparam, text
+
+from .db import db_all, engine
+from .packing import decode_answers, decode_mask
+from .survey import scas_meta
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", str(BASE_DIR / "archive")))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+CHUNK = 500  # respuestas por transacción
+
+_DELETE_ITEMS = text(
+    "DELETE FROM response_items WHERE response_id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+_MARK_ARCHIVED = text(
+    "UPDATE responses SET archived_at=CURRENT_TIMESTAMP, answers_packed=NULL WHERE id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def _month_path(month: str) -> Path:
+    return ARCHIVE_DIR / f"response_items-{month}.jsonl.gz"
+
+
+def _months_before(horizon: datetime) -> List[str]:
+    rows = db_all(
+        """
+        SELECT DISTINCT DATE_FORMAT(created_at, '%Y-%m') AS m
+        FROM responses
+        WHERE created_at < :h AND archived_at IS NULL
+        ORDER BY m
+        """,
+        {"h": horizon},
+        primary=True,
+    )
+    return [r["m"] for r in rows]
+
+
+def _archive_month(month: str, horizon: datetime) -> int:
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+    rows = db_all(
+        """
+        SELECT r.id AS response_id, r.user_id, r.survey_id, r.created_at,
+               si.item_number, ri.value
+        FROM responses r
+        JOIN response_items ri ON ri.response_id = r.id
+        JOIN survey_items si   ON si.id = ri.item_id
+        WHERE r.created_at >= :a AND r.created_at < :b AND r.created_at < :h
+          AND r.archived_at IS NULL
+        ORDER BY r.id, si.item_number
+        """,
+        {"a": start, "b": end, "h": horizon},
+        primary=True,
+    )
+    ids_with_items = set()
+    records: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        rec = records.get(row["response_id"])
+        if rec is None:
+            rec = records[row["response_id"]] = {
+                "response_id": row["response_id"],
+                "user_id": row["user_id"],
+                "survey_id": row["survey_id"],
+                "created_at": row["created_at"].isoformat(),
+                "answers": {},
+            }
+        rec["answers"][str(row["item_number"])] = int(row["value"])
+        ids_with_items.add(row["response_id"])
+
+    # Respuestas del mes sin filas de detalle: empaquetadas (se archivan
+    # desempaquetadas y se limpia la columna) o sin detalle (solo se marcan)
+    bare = []
+    for r in db_all(
+        """
+        SELECT id, user_id, survey_id, created_at, answers_packed, answers_mask FROM responses
+        WHERE created_at >= :a AND created_at < :b AND created_at < :h
+          AND archived_at IS NULL
+        """,
+        {"a": start, "b": end, "h": horizon},
+        primary=True,
+    ):
+        if r["id"] in ids_with_items:
+            continue
+        if r["answers_packed"]:
+            values = decode_answers(r["answers_packed"])
+            answered = decode_mask(r["answers_mask"])
+            records[r["id"]] = {
+                "response_id": r["id"],
+                "user_id": r["user_id"],
+                "survey_id": r["survey_id"],
+                "created_at": r["created_at"].isoformat(),
+                "answers": {str(n): int(v) for n, (v, ok) in enumerate(zip(values, answered), start=1)
+                            if ok},
+            }
+        else:
+            bare.append(r["id"])
+
+    if records:
+        # Primero a disco (miembro gzip agregado), después se borra de la BD.
+        # Si algo falla en medio, rehydrate usa INSERT IGNORE y no duplica.
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _month_path(month)
+        with gzip.open(path, "at", encoding="utf-8") as fh:
+            for rec in records.values():
+                fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        with open(path, "rb") as fh:
+            os.fsync(fh.fileno())
+
+    ids = list(records) + bare
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        with engine().begin() as conn:
+            conn.execute(_DELETE_ITEMS, {"ids": chunk})
+            conn.execute(_MARK_ARCHIVED, {"ids": chunk})
+    return len(records)
+
+
+def archive_older_than(days: int = ARCHIVE_AFTER_DAYS) -> Dict[str, int]:
+    """Archiva mes a mes el detalle de respuestas con más de `days` días."""
+    horizon = datetime.utcnow() - timedelta(days=days)
+    out = {}
+    for month in _months_before(horizon):
+        out[month] = _archive_month(month, horizon)
+    return out
+
+
+def archived_months() -> List[str]:
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(p.name[len("response_items-"):-len(".jsonl.gz")]
+                  for p in ARCHIVE_DIR.glob("response_items-*.jsonl.gz"))
+
+
+def iter_archived(since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Recorre respuestas archivadas entre los meses `since` y `until` ("YYYY-MM", inclusive)."""
+    for month in archived_months():
+        if (since and month < since) or (until and month > until):
+            continue
+        seen = set()
+        with gzip.open(_month_path(month), "rt", encoding="utf-8") as fh:
+            for line in fh:
+                rec = json.loads(line)
+                if rec["response_id"] in seen:
+                    continue
+                seen.add(rec["response_id"])
+                yield rec
+
+
+def rehydrate(month: str) -> int:
+    """Vuelve a cargar a response_items el detalle archivado de `month`."""
+    meta = scas_meta()
+    by_number = meta["by_number"] if meta else {}
+    ids, rows = [], []
+    for rec in iter_archived(month, month):
+        ids.append(rec["response_id"])
+        for n, v in rec["answers"].items():
+            iid = by_number.get(int(n))
+            if iid is not None:
+                rows.append({"r": rec["response_id"], "i": iid, "v": v, "c": rec["created_at"]})
+    if not rows:
+        return 0
+    with engine().begin() as conn:
+        conn.execute(
+            text(
+                """
+                INSERT IGNORE INTO response_items(response_id, item_id, value, created_at)
+                VALUES (:r, :i, :v, :c)
+                """
+            ),
+            rows,
+        )
+        for i in range(0, len(ids), CHUNK):
+            conn.execute(
+                text("UPDATE responses SET archived_at=NULL WHERE id IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": ids[i:i + CHUNK]},
+            )
+    return len(ids)
+
+
+# -------- CLI --------
+@click.command("archive-responses")
+@click.option("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS, show_default=True)
+def archive_command(older_than_days):
+    """Mueve el detalle por ítem de respuestas antiguas a archivos mensuales."""
+    done = archive_older_than(older_than_days)
+    for month, n in done.items():
+        click.echo(f"{month}: {n} respuestas archivadas")
+    if not done:
+        click.echo("Nada que archivar.")
+
+
+@click.command("rehydrate-responses")
+@click.argument("month")
+def rehydrate_command(month):
+    """Restaura a response_items el detalle archivado de MONTH (YYYY-MM)."""
+    click.echo(f"{month}: {rehydrate(month)} respuestas restauradas")
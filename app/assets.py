@@ -0,0 +1,173 @@
+# app/assets.py
+"""
+Servidor de archivos de public/ desde memoria.
+
+Al arrancar:
+- app.js y styles.css se publican además con huella de contenido
+  (app.<hash>.js, styles.<hash>.css) y caché inmutable de un año;
+- las páginas HTML se reescriben para apuntar a esos nombres;
+- todo lo de texto se precomprime (gzip y, si está instalado, brotli);
+- sw.js (service worker del alumno) nunca se cachea sin revalidar.
+
+Cada request solo elige la variante según Accept-Encoding, responde 304 si
+el ETag de esa variante coincide (cada codificación tiene el suyo:
+"<hash>", "<hash>-gzip", "<hash>-br") y devuelve los bytes ya preparados
+(sin Jinja ni disco).
+Con app.debug se reconstruye si cambió algún archivo.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask import Response, abort, request
+
+from .compress import COMPRESSIBLE, brotli, choose_encoding
+
+FINGERPRINTED = ("app.js", "styles.css")
+# El service worker debe conservar su nombre y revalidarse siempre (si no, el
+# navegador no ve versiones nuevas hasta que venza su caché HTTP)
+UNVERSIONED = ("sw.js",)
+
+# Rutas "bonitas" -> archivo
+ALIASES = {
+    "": "index.html",
+    "register": "register.html",
+    "student": "student.html",
+    "results": "results.html",
+    "admin": "admin.html",
+}
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"          # HTML y nombres sin huella: siempre revalidar (ETag)
+CACHE_SHORT = "public, max-age=3600"   # resto (imágenes, etc.)
+
+
+class Asset:
+    __slots__ = ("body", "variants", "etag", "mimetype", "cache_control")
+
+    def etag_for(self, encoding: Optional[str]) -> str:
+        """ETag fuerte de la variante servida (identity si `encoding` es None)."""
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+    def __init__(self, body: bytes, mimetype: str, cache_control: str):
+        self.body = body
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        self.variants: Dict[str, bytes] = {}
+        if mimetype.split(";")[0] in COMPRESSIBLE and len(body) > 256:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+
+
+def _mimetype(name: str) -> str:
+    mt = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if mt.startswith("text/") or mt == "application/javascript":
+        mt += "; charset=utf-8"
+    return mt
+
+
+def _fingerprint(name: str, body: bytes) -> str:
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{hashlib.sha256(body).hexdigest()[:10]}.{ext}"
+
+
+class AssetStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.assets: Dict[str, Asset] = {}
+        self.manifest: Dict[str, str] = {}   # "app.js" -> "app.<hash>.js"
+        self._stamp = None
+
+    def _scan_stamp(self):
+        return tuple(sorted((p.name, p.stat().st_mtime_ns) for p in self.root.iterdir() if p.is_file()))
+
+    def build(self) -> None:
+        assets: Dict[str, Asset] = {}
+        manifest: Dict[str, str] = {}
+        files = {p.name: p.read_bytes() for p in self.root.iterdir() if p.is_file()}
+
+        for name in FINGERPRINTED:
+            if name in files:
+                hashed = _fingerprint(name, files[name])
+                manifest[name] = hashed
+                assets[hashed] = Asset(files[name], _mimetype(name), CACHE_IMMUTABLE)
+
+        if manifest:
+            pattern = re.compile(
+                r'((?:href|src)=["\'])(' + "|".join(re.escape(n) for n in manifest) + r')(["\'])'
+            )
+
+        for name, body in files.items():
+            if name.endswith(".html"):
+                if manifest:
+                    html = pattern.sub(lambda m: m.group(1) + manifest[m.group(2)] + m.group(3),
+                                       body.decode("utf-8"))
+                    body = html.encode("utf-8")
+                assets[name] = Asset(body, _mimetype(name), CACHE_REVALIDATE)
+            elif name in FINGERPRINTED or name in UNVERSIONED:
+                assets[name] = Asset(body, _mimetype(name), CACHE_REVALIDATE)
+            else:
+                assets[name] = Asset(body, _mimetype(name), CACHE_SHORT)
+
+        self.assets, self.manifest = assets, manifest
+        self._stamp = self._scan_stamp()
+
+    def refresh_if_changed(self) -> None:
+        if self._scan_stamp() != self._stamp:
+            self.build()
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        path = path.strip("/")
+        return self.assets.get(ALIASES.get(path, path))
+
+    def serve(self, path: str) -> Response:
+        asset = self.lookup(path)
+        if asset is None:
+            abort(404)
+
+        enc = choose_encoding(request.headers.get("Accept-Encoding", "")) if asset.variants else None
+        enc = enc if enc in asset.variants else None
+        etag = asset.etag_for(enc)
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": asset.cache_control,
+        }
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag in request.if_none_match:
+            resp = Response(status=304, headers=headers)
+            resp.direct_passthrough = True
+            return resp
+
+        body = asset.body
+        if enc:
+            body = asset.variants[enc]
+            headers["Content-Encoding"] = enc
+
+        resp = Response(body, headers=headers, content_type=asset.mimetype)
+        resp.direct_passthrough = True  # ya viene comprimido: que after_request no lo toque
+        return resp
+
+
+def init_assets(app, root: Path) -> AssetStore:
+    """Registra las rutas de páginas y archivos de `root` servidos desde memoria."""
+    store = AssetStore(root)
+    store.build()
+    app.extensions["assets"] = store
+
+    @app.get("/", endpoint="home")
+    @app.get("/<path:filename>", endpoint="public_files")
+    def public_files(filename: str = ""):
+        if app.debug:
+            store.refresh_if_changed()
+        return store.serve(filename)
+
+    return store
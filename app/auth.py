@@ -4,14 +4,23 @@ Rutas de autenticación (registro, login, perfil).
 Dependen de:
 - db_one, db_exec (helpers en app.db)
 - make_token, require_auth, EMAIL_ALLOWED, NAME_ALLOWED (en app.utils)
-- passlib[bcrypt] para hashing seguro
+- hash_password, verify_password (app.passwords: bcrypt en pool acotado)
+- tenant_by_code (app.tenants): el campo opcional `school` elige el colegio;
+  sin él se usa el colegio principal. El token lleva su id en `tid`. Para
+  registrarse en un colegio además hay que enviar su código de acceso
+  (`join_code`).
 """
 
 from flask import Blueprint, request, jsonify
-from passlib.hash import bcrypt
 from sqlalchemy.exc import IntegrityError
 
 from .db import db_one, db_exec
+from .passwords import HashPoolBusy, hash_password, needs_rehash, verify_password
+from .ratelimit import limit
+from . import search
+from .tenancy import DEFAULT_TENANT, set_request_tenant
+from .tenants import check_join_code, tenant_by_code
+from .users import invalidate_user
 from .utils import make_token, require_auth, EMAIL_ALLOWED, NAME_ALLOWED
 
 # Prefijo /auth para que tus llamadas del front sean /auth/register y /auth/login
@@ -24,6 +33,26 @@ def _payload() -> dict:
     return request.get_json(silent=True) or request.form or {}
 
 
+def _email_key():
+    return (_payload().get("email") or "").strip().lower() or None
+
+
+def _school():
+    """
+    Colegio pedido en el payload (`school` = código). Fija el tenant del
+    request (y con él la base a usar). Devuelve su id o None si no existe.
+    """
+    code = (_payload().get("school") or "").strip()
+    if not code:
+        set_request_tenant(DEFAULT_TENANT)
+        return DEFAULT_TENANT
+    t = tenant_by_code(code)
+    if not t:
+        return None
+    set_request_tenant(t["id"])
+    return t["id"]
+
+
 def _ok(**data):
     return jsonify({"ok": True, **data})
 
@@ -32,9 +61,18 @@ def _bad(msg: str, code: int = 400):
     return jsonify({"ok": False, "error": msg}), code
 
 
+@bp.errorhandler(HashPoolBusy)
+def _busy(_e):
+    # Ola de logins: se rechaza rápido en vez de bloquear el worker
+    resp, code = _bad("Servidor ocupado, intenta de nuevo en unos segundos.", 503)
+    resp.headers["Retry-After"] = "2"
+    return resp, code
+
+
 # -------- endpoints --------
 
 @bp.post("/register")
+@limit("register", ip="300/600", account="5/600", concurrency=16, account_key=_email_key)
 def register():
     data = _payload()
 
@@ -65,17 +103,25 @@ def register():
     if gender and gender not in ("M", "F"):
         return _bad("Género inválido (usa M o F).")
 
+    tid = _school()
+    if tid is None:
+        return _bad("Colegio no encontrado.")
+    school = (data.get("school") or "").strip()
+    if school and not check_join_code(tenant_by_code(school), data.get("join_code")):
+        return _bad("Código de acceso del colegio inválido.", 403)
+
     role = "student"
 
     # Inserción con captura de UNIQUE(email)
-    pwd_hash = bcrypt.hash(password)
+    pwd_hash = hash_password(password)
     try:
         affected = db_exec(
             """
-            INSERT INTO users (fullname, email, password_hash, role, gender, age)
-            VALUES (:fn, :em, :ph, :ro, :ge, :ag)
+            INSERT INTO users (fullname, email, password_hash, role, tenant_id, gender, age)
+            VALUES (:fn, :em, :ph, :ro, :tid, :ge, :ag)
             """,
-            {"fn": fullname, "em": email, "ph": pwd_hash, "ro": role, "ge": (gender or None), "ag": age}
+            {"fn": fullname, "em": email, "ph": pwd_hash, "ro": role, "tid": tid,
+             "ge": (gender or None), "ag": age}
         )
         if not affected:
             return _bad("No se pudo registrar. Intenta nuevamente.", 500)
@@ -83,14 +129,17 @@ def register():
         return _bad("Ya existe un usuario registrado con este correo.")
 
     # Recupera id para incluirlo en el token/respuesta
-    user = db_one("SELECT id FROM users WHERE email=:e", {"e": email})
+    user = db_one("SELECT id FROM users WHERE email=:e", {"e": email}, primary=True)
     uid = user["id"] if user else None
+    if uid and role == "student":
+        search.for_tenant(tid).add({"id": uid, "fullname": fullname, "email": email})
 
-    token = make_token({"id": uid, "email": email, "role": role, "fullname": fullname})
-    return _ok(token=token, id=uid, role=role, fullname=fullname, email=email)
+    token = make_token({"id": uid, "email": email, "role": role, "fullname": fullname, "tid": tid})
+    return _ok(token=token, id=uid, role=role, fullname=fullname, email=email, tid=tid)
 
 
 @bp.post("/login")
+@limit("login", ip="600/60", account="5/60", concurrency=32, account_key=_email_key)
 def login():
     data = _payload()
     email    = (data.get("email") or "").strip().lower()
@@ -98,19 +147,39 @@ def login():
 
     if not email or not password:
         return _bad("Faltan credenciales.")
+    if _school() is None:
+        return _bad("Colegio no encontrado.")
 
-    user = db_one("SELECT id, fullname, email, role, password_hash FROM users WHERE email=:e", {"e": email})
+    user = db_one(
+        "SELECT id, fullname, email, role, tenant_id, password_hash FROM users WHERE email=:e",
+        {"e": email}, primary=True
+    )
     if not user:
         return _bad("Usuario no encontrado.")
-    if not bcrypt.verify(password, user["password_hash"]):
+    if not verify_password(password, user["password_hash"]):
         return _bad("Contraseña incorrecta.")
 
-    token = make_token({"id": user["id"], "email": user["email"], "role": user["role"], "fullname": user["fullname"]})
-    return _ok(token=token, id=user["id"], role=user["role"], fullname=user["fullname"], email=user["email"])
+    # Si cambió BCRYPT_ROUNDS, actualiza el hash ahora que conocemos la contraseña
+    if needs_rehash(user["password_hash"]):
+        try:
+            db_exec(
+                "UPDATE users SET password_hash=:ph WHERE id=:id",
+                {"ph": hash_password(password), "id": user["id"]}
+            )
+            invalidate_user(user["id"])
+        except HashPoolBusy:
+            pass  # se reintenta en el próximo login
+
+    tid = user["tenant_id"]
+    token = make_token({"id": user["id"], "email": user["email"], "role": user["role"],
+                        "fullname": user["fullname"], "tid": tid})
+    return _ok(token=token, id=user["id"], role=user["role"], fullname=user["fullname"],
+               email=user["email"], tid=tid)
 
 
 @bp.get("/me")
 @require_auth()
 def me():
     u = request.user  # establecido por require_auth()
-    return _ok(id=u.get("id"), email=u.get("email"), role=u.get("role"), fullname=u.get("fullname"))
+    return _ok(id=u.get("id"), email=u.get("email"), role=u.get("role"), fullname=u.get("fullname"),
+               tid=u.get("tid", DEFAULT_TENANT))
@@ -0,0 +1,297 @@
+# app/bulk.py
+"""
+Importación masiva de intentos SCAS capturados offline (papel / tablets sin red).
+
+Formatos aceptados (uno por intento):
+- JSON Lines: {"email": "...", "timestamp": "2025-03-01T10:15:00", "answers": [44 valores]}
+  (`answers` también puede ser un objeto {"1": 0, ..., "44": 3} por número de ítem)
+- CSV con cabecera: email,timestamp,item_1,...,item_44
+
+Todo se valida en una sola pasada contra los metadatos cacheados de la
+encuesta; los usuarios se resuelven con un único SELECT ... IN por bloque y
+las inserciones van en transacciones grandes (executemany para el detalle).
+Devuelve un reporte con los errores por línea.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+from sqlalchemy import bindparam, text
+
+from . import analytics, neighbors
+from .db import db_all, engine, tenant_routed
+from .packing import WRITE_PACKED, WRITE_ROWS, encode_answers
+from .snapshot import open_snapshot, sync as snapshot_sync
+from .survey import scas_meta, score_answers
+from .tenancy import DEFAULT_TENANT, use_tenant
+
+N_ITEMS = 44
+BATCH_SIZE = 500      # intentos por transacción
+LOOKUP_CHUNK = 1000   # correos por SELECT ... IN
+
+_USERS_BY_EMAIL = text(
+    "SELECT id, email FROM users WHERE tenant_id=:tid AND email IN :emails"
+).bindparams(bindparam("emails", expanding=True))
+
+_EXISTING = text(
+    """
+    SELECT user_id, created_at FROM responses
+    WHERE survey_id=:sid AND user_id IN :uids
+    """
+).bindparams(bindparam("uids", expanding=True))
+
+
+# -------- parsing --------
+def _parse_ts(raw: Any) -> datetime:
+    """ISO 8601 -> datetime naive en UTC (como guarda la BD)."""
+    s = str(raw or "").strip()
+    if not s:
+        raise ValueError("falta timestamp")
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(s.replace(" ", "T", 1))
+    except ValueError:
+        raise ValueError(f"timestamp inválido: {raw!r}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _parse_answers(raw: Any) -> List[int]:
+    """Devuelve 44 valores 0..3 ordenados por número de ítem (1..44)."""
+    if isinstance(raw, dict):
+        try:
+            pairs = {int(k): v for k, v in raw.items()}
+        except (TypeError, ValueError):
+            raise ValueError("claves de answers deben ser números de ítem")
+        missing = [n for n in range(1, N_ITEMS + 1) if n not in pairs]
+        if missing:
+            raise ValueError(f"faltan ítems: {missing[:5]}")
+        raw = [pairs[n] for n in range(1, N_ITEMS + 1)]
+    if not isinstance(raw, (list, tuple)) or len(raw) != N_ITEMS:
+        raise ValueError(f"se esperan {N_ITEMS} respuestas")
+    out = []
+    for n, v in enumerate(raw, start=1):
+        try:
+            iv = int(str(v).strip())
+        except (TypeError, ValueError):
+            raise ValueError(f"ítem {n}: valor no numérico {v!r}")
+        if iv < 0 or iv > 3:
+            raise ValueError(f"ítem {n}: valor fuera de rango 0..3")
+        out.append(iv)
+    return out
+
+
+def _iter_jsonl(fh: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    for lineno, line in enumerate(fh, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield lineno, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield lineno, ValueError(f"JSON inválido: {e.msg}")
+
+
+def _iter_csv(fh: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+    reader = csv.DictReader(fh)
+    cols = [f"item_{n}" for n in range(1, N_ITEMS + 1)]
+    for rec in reader:
+        lineno = reader.line_num
+        if not any((v or "").strip() for v in rec.values() if isinstance(v, str)):
+            continue
+        yield lineno, {
+            "email": rec.get("email"),
+            "timestamp": rec.get("timestamp"),
+            "answers": [rec.get(c) for c in cols],
+        }
+
+
+def parse_records(fh: Iterable[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Itera (línea, dict | ValueError) según `fmt` ('jsonl' o 'csv')."""
+    if fmt == "csv":
+        return _iter_csv(fh)
+    if fmt == "jsonl":
+        return _iter_jsonl(fh)
+    raise ValueError(f"formato no soportado: {fmt}")
+
+
+# -------- validación + carga --------
+def _validate(records, meta) -> Tuple[List[dict], List[dict]]:
+    by_number = meta["by_number"]
+    if len(by_number) < N_ITEMS:
+        raise RuntimeError("La encuesta SCAS no tiene sus 44 ítems sembrados")
+    ok, errors = [], []
+    for lineno, rec in records:
+        try:
+            if isinstance(rec, Exception):
+                raise rec
+            if not isinstance(rec, dict):
+                raise ValueError("registro no es un objeto")
+            email = (rec.get("email") or "").strip().lower()
+            if not email:
+                raise ValueError("falta email")
+            values = _parse_answers(rec.get("answers"))
+            normalized = [(by_number[n], v) for n, v in enumerate(values, start=1)]
+            total, subs = score_answers(normalized, meta["items"])
+            ok.append({
+                "line": lineno, "email": email, "ts": _parse_ts(rec.get("timestamp")),
+                "items": normalized, "total": total, "subs": subs,
+                "packed": encode_answers(values),
+            })
+        except ValueError as e:
+            errors.append({"line": lineno, "error": str(e)})
+    return ok, errors
+
+
+def _resolve_users(tid: int, emails: List[str]) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for i in range(0, len(emails), LOOKUP_CHUNK):
+        chunk = emails[i:i + LOOKUP_CHUNK]
+        for r in db_all(_USERS_BY_EMAIL, {"tid": tid, "emails": chunk}, primary=True):
+            out[r["email"].lower()] = r["id"]
+    return out
+
+
+def _existing_attempts(sid: int, uids: List[int]) -> set:
+    seen = set()
+    for i in range(0, len(uids), LOOKUP_CHUNK):
+        chunk = uids[i:i + LOOKUP_CHUNK]
+        for r in db_all(_EXISTING, {"sid": sid, "uids": chunk}, primary=True):
+            seen.add((r["user_id"], r["created_at"].replace(microsecond=0)))
+    return seen
+
+
+def _insert_batch(sid: int, tid: int, batch: List[dict]) -> None:
+    with engine().begin() as conn:
+        detail = []
+        for rec in batch:
+            rid = conn.execute(
+                text(
+                    """
+                    INSERT INTO responses(user_id, tenant_id, survey_id, total_score, created_at,
+                                          gad, soc, ocd, paa, phb, sad, answers_packed)
+                    VALUES (:u, :tid, :s, :t, :c, :GAD, :SOC, :OCD, :PAA, :PHB, :SAD, :ap)
+                    """
+                ),
+                {"u": rec["uid"], "tid": tid, "s": sid, "t": rec["total"], "c": rec["ts"], **rec["subs"],
+                 "ap": rec["packed"] if WRITE_PACKED else None},
+            ).lastrowid
+            if WRITE_ROWS:
+                detail.extend(
+                    {"r": rid, "i": iid, "v": val, "c": rec["ts"]} for iid, val in rec["items"]
+                )
+        if detail:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO response_items(response_id, item_id, value, created_at)
+                    VALUES (:r, :i, :v, :c)
+                    """
+                ),
+                detail,
+            )
+
+
+def import_attempts(records, dry_run: bool = False,
+                    tenant: int = DEFAULT_TENANT) -> Dict[str, Any]:
+    """
+    Valida e inserta intentos en el colegio `tenant`. Reporte:
+    { received, imported, skipped, errors: [{line, error}, ...], dry_run }
+    Los intentos ya presentes (mismo usuario y misma fecha) se omiten, así
+    reimportar un archivo no duplica datos. Solo se aceptan correos de
+    alumnos de ese colegio.
+    """
+    with use_tenant(tenant):
+        return _import(records, dry_run, tenant)
+
+
+def _import(records, dry_run: bool, tid: int) -> Dict[str, Any]:
+    meta = scas_meta()
+    if not meta:
+        raise RuntimeError("Encuesta SCAS_CHILD no encontrada")
+    sid = meta["sid"]
+
+    valid, errors = _validate(records, meta)
+    received = len(valid) + len(errors)
+    users = _resolve_users(tid, sorted({r["email"] for r in valid}))
+    existing = _existing_attempts(sid, sorted(set(users.values())))
+
+    pending, skipped = [], 0
+    for rec in valid:
+        uid = users.get(rec["email"])
+        if uid is None:
+            errors.append({"line": rec["line"], "error": f"usuario no registrado: {rec['email']}"})
+            continue
+        key = (uid, rec["ts"].replace(microsecond=0))
+        if key in existing:
+            skipped += 1
+            continue
+        existing.add(key)
+        rec["uid"] = uid
+        pending.append(rec)
+
+    if not dry_run:
+        for i in range(0, len(pending), BATCH_SIZE):
+            _insert_batch(sid, tid, pending[i:i + BATCH_SIZE])
+        # El snapshot solo cubre la base principal
+        if pending and not tenant_routed(tid) and open_snapshot() is not None:
+            snapshot_sync()
+        if pending:
+            from .admin import invalidate_panel  # admin importa bulk en la ruta /import
+
+            invalidate_panel(tid)
+            analytics.invalidate(tid)
+            neighbors.for_tenant(tid).invalidate()
+
+    errors.sort(key=lambda e: e["line"])
+    return {
+        "received": received,
+        "imported": 0 if dry_run else len(pending),
+        "valid": len(pending),
+        "skipped": skipped,
+        "errors": errors,
+        "dry_run": dry_run,
+    }
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith(".csv") or "csv" in ctype:
+        return "csv"
+    return "jsonl"
+
+
+# -------- CLI --------
+@click.command("import-scas")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["jsonl", "csv"]), default=None,
+              help="Por defecto se deduce de la extensión.")
+@click.option("--dry-run", is_flag=True, help="Solo valida, no inserta.")
+@click.option("--tenant", "tenant_code", default=None,
+              help="Código del colegio (por defecto el principal).")
+def import_scas_command(path, fmt, dry_run, tenant_code):
+    """Importa intentos SCAS offline desde un archivo JSON Lines o CSV."""
+    tid = DEFAULT_TENANT
+    if tenant_code:
+        from .tenants import tenant_by_code
+
+        t = tenant_by_code(tenant_code)
+        if not t:
+            raise click.BadParameter(f"colegio no encontrado: {tenant_code}", param_hint="--tenant")
+        tid = t["id"]
+    fmt = fmt or detect_format(path, None)
+    with open(path, encoding="utf-8-sig", newline="") as fh:
+        report = import_attempts(parse_records(fh, fmt), dry_run=dry_run, tenant=tid)
+    for e in report["errors"]:
+        click.echo(f"línea {e['line']}: {e['error']}", err=True)
+    click.echo(
+        f"importados={report['imported']} válidos={report['valid']} "
+        f"omitidos={report['skipped']} errores={len(report['errors'])}"
+    )
@@ -0,0 +1,64 @@
+# app/cache.py
+"""
+Caché en memoria por proceso (thread-safe) con expiración por TTL y tamaño
+acotado. Pensado para datos chicos que casi no cambian (metadatos de la
+encuesta, filas de usuario, agregados) y que hoy se releen en cada request.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU acotado a `maxsize` entradas; cada entrada vence a los `ttl` segundos."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key, _MISSING)
+            if hit is _MISSING:
+                return default
+            expires, value = hit
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Devuelve el valor cacheado o lo calcula con `factory()` (None no se cachea)."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,99 @@
+# app/compress.py
+"""
+Compresión negociada (br / gzip) de respuestas dinámicas.
+
+Se aplica en after_request a respuestas JSON/texto por encima de un umbral
+(COMPRESS_MIN_SIZE, por defecto 1 KB). Se saltan las respuestas en streaming
+(SSE), las de archivos (direct_passthrough) y las que ya traen
+Content-Encoding. Brotli es opcional: sin el paquete `brotli` solo hay gzip.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # opcional
+    brotli = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE = {
+    "application/json", "application/x-ndjson", "text/html", "text/css",
+    "text/plain", "text/csv", "application/javascript", "text/javascript",
+    "image/svg+xml",
+}
+
+
+def accepted_encodings(header: str) -> dict:
+    """Parsea Accept-Encoding -> {codificación: q}."""
+    out = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[token] = q
+    return out
+
+
+def choose_encoding(header: str):
+    """'br', 'gzip' o None según lo que acepta el cliente y lo disponible."""
+    acc = accepted_encodings(header)
+    star = acc.get("*", 0.0)
+    options = []
+    if brotli is not None:
+        options.append("br")
+    options.append("gzip")
+    best, best_q = None, 0.0
+    for enc in options:
+        q = acc.get(enc, star)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compress_response(resp):
+    if (resp.status_code < 200 or resp.status_code in (204, 206, 304)
+            or resp.direct_passthrough or resp.is_streamed
+            or "Content-Encoding" in resp.headers
+            or resp.mimetype not in COMPRESSIBLE):
+        return resp
+
+    resp.vary.add("Accept-Encoding")
+    enc = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if not enc:
+        return resp
+    data = resp.get_data()
+    if len(data) < MIN_SIZE:
+        return resp
+
+    resp.set_data(compress(data, enc))
+    resp.headers["Content-Encoding"] = enc
+    tag, weak = resp.get_etag()
+    if tag and not weak:
+        # ETag fuerte -> débil: el cuerpo codificado no es byte a byte el original
+        resp.set_etag(tag, weak=True)
+    return resp
+
+
+def init_compression(app) -> None:
+    app.after_request(_compress_response)
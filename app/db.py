@@ -1,8 +1,15 @@
 # app/db.py
 import os
-from sqlalchemy import create_engine, text
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import URL, bindparam, create_engine, make_url, text
 from urllib.parse import urlparse, unquote
-from passlib.hash import bcrypt  # para hashear contraseñas
+from . import metrics
+from .cache import TTLCache
+from .statements import Statement
+from .passwords import hash_password
+from .tenancy import DEFAULT_TENANT, current_tenant
 
 # ----------------------------
 # Config desde variables .env
@@ -16,9 +23,33 @@ DB_NAME = os.getenv("DB_NAME", "tesis_ansiedad")
 SERVER_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}"
 DATABASE_URL = f"{SERVER_URL}/{DB_NAME}?charset=utf8mb4"
 
+# Réplica de solo lectura (opcional): DATABASE_REPLICA_URL completo o DB_REPLICA_HOST
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or (
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:"
+    f"{os.getenv('DB_REPLICA_PORT', DB_PORT)}/{DB_NAME}?charset=utf8mb4"
+    if DB_REPLICA_HOST else None
+)
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))          # segundos
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+# Pool de conexiones (en modo gevent hay muchos requests en vuelo por worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
 # Engines (perezosos)
 _server_engine = None
 _engine = None
+_replica_engine = None
+_replica_state = {"ok": False, "checked": 0.0, "lag": None}
+_pin_primary: ContextVar[bool] = ContextVar("pin_primary", default=False)
+
+# Colegios con base propia (tenants.db_url): engine por URL, URL cacheada por id
+_tenant_engines = {}
+_tenant_engine_ids = {}  # url -> id del colegio (nombre del engine en métricas)
+_tenant_urls = TTLCache(maxsize=1024, ttl=float(os.getenv("TENANT_URL_TTL", "60")))
 
 
 def server_engine():
@@ -31,25 +62,172 @@ def server_engine():
     return _server_engine
 
 
-def engine():
-    """Engine de la base de datos de la app."""
+def main_engine():
+    """Engine de la base principal (la de tenants y de los colegios sin base propia)."""
     global _engine
     if _engine is None:
         _engine = create_engine(
-            DATABASE_URL, future=True, pool_pre_ping=True
+            DATABASE_URL, future=True, pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
         )
     return _engine
 
 
+def _tenant_url(tid: int) -> str:
+    """db_url del colegio ("" si usa la base principal)."""
+    if tid == DEFAULT_TENANT:
+        return ""
+
+    def load():
+        with main_engine().connect() as conn:
+            row = conn.execute(text("SELECT db_url FROM tenants WHERE id=:t"), {"t": tid}).first()
+        return (row[0] if row else None) or ""
+
+    return _tenant_urls.get_or_set(tid, load)
+
+
+def _tenant_engine(url: str, tid: int):
+    _tenant_engine_ids[url] = tid
+    eng = _tenant_engines.get(url)
+    if eng is None:
+        eng = _tenant_engines.setdefault(url, create_engine(
+            url, future=True, pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+        ))
+    return eng
+
+
+def tenant_routed(tid=None) -> bool:
+    """True si el colegio (por defecto el del request) tiene base propia."""
+    return bool(_tenant_url(current_tenant() if tid is None else tid))
+
+
+def forget_tenant(tid: int) -> None:
+    """Olvida la URL cacheada (tras crear o mover un colegio)."""
+    _tenant_urls.pop(tid)
+
+
+def engine():
+    """Engine de la base del colegio en curso (la principal salvo tenants.db_url)."""
+    tid = current_tenant()
+    url = _tenant_url(tid)
+    return _tenant_engine(url, tid) if url else main_engine()
+
+
+def replica_engine():
+    """Engine de la réplica o None si no hay réplica configurada."""
+    global _replica_engine
+    if _replica_engine is None and DATABASE_REPLICA_URL:
+        _replica_engine = create_engine(
+            DATABASE_REPLICA_URL, future=True, pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+        )
+    return _replica_engine
+
+
+def _replica_lag(eng):
+    """Segundos de retraso de la réplica (0 si no reporta estado de réplica)."""
+    with eng.connect() as conn:
+        try:
+            row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+        except Exception:
+            row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+    if row is None:
+        return 0.0  # endpoint de lectura gestionado / proxy: no expone estado
+    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+    return None if lag is None else float(lag)  # None = replicación detenida
+
+
+def replica_healthy():
+    """Estado cacheado (REPLICA_CHECK_INTERVAL) de la réplica respecto a REPLICA_MAX_LAG."""
+    eng = replica_engine()
+    if eng is None:
+        return False
+    now = time.monotonic()
+    if now - _replica_state["checked"] >= REPLICA_CHECK_INTERVAL:
+        _replica_state["checked"] = now
+        try:
+            lag = _replica_lag(eng)
+        except Exception as e:
+            print("[DB] réplica no disponible:", e)
+            lag = None
+        _replica_state["lag"] = lag
+        _replica_state["ok"] = lag is not None and lag <= REPLICA_MAX_LAG
+        metrics.inc("db.replica_check", healthy=_replica_state["ok"])
+    return _replica_state["ok"]
+
+
+@contextmanager
+def use_primary():
+    """Fija todas las lecturas del bloque a la primaria (leer lo recién escrito)."""
+    token = _pin_primary.set(True)
+    try:
+        yield
+    finally:
+        _pin_primary.reset(token)
+
+
+def _write_target():
+    """Engine de escritura y su nombre en las métricas (el mismo que usan las lecturas)."""
+    tid = current_tenant()
+    url = _tenant_url(tid)
+    if url:
+        return _tenant_engine(url, tid), f"tenant{tid}"
+    return main_engine(), "primary"
+
+
+def _read_target(primary=False):
+    if tenant_routed():
+        return _write_target()  # base propia: sin réplica
+    if primary or _pin_primary.get() or replica_engine() is None:
+        return engine(), "primary"
+    if not replica_healthy():
+        metrics.inc("db.replica_fallback")
+        return engine(), "primary"
+    return replica_engine(), "replica"
+
+
+def pool_status():
+    """
+    Estado de los pools por engine (para /api/admin/metrics), con los mismos
+    nombres que las métricas de consultas; sin host ni base de cada colegio.
+    """
+    out = {"primary": main_engine().pool.status()}
+    for url, eng in list(_tenant_engines.items()):
+        out[f"tenant{_tenant_engine_ids[url]}"] = eng.pool.status()
+    if replica_engine() is not None:
+        out["replica"] = replica_engine().pool.status()
+        out["replica_lag"] = _replica_state["lag"]
+        out["replica_ok"] = _replica_state["ok"]
+    return out
+
+
 # ----------------------------
 # Bootstrap de base de datos
 # ----------------------------
-def create_database_if_needed():
-    """Crea la base si no existe (utf8mb4)."""
-    with server_engine().begin() as conn:
+def create_database_if_needed(db_url=None):
+    """Crea la base si no existe (utf8mb4): la principal o la de `db_url`."""
+    if not db_url:
+        _create_database(server_engine(), DB_NAME)
+        return
+    url = make_url(db_url)
+    server = URL.create(url.drivername, url.username, url.password, url.host, url.port,
+                        query=url.query)
+    eng = create_engine(server, future=True)
+    try:
+        _create_database(eng, url.database)
+    finally:
+        eng.dispose()
+
+
+def _create_database(eng, name):
+    with eng.begin() as conn:
         conn.execute(
             text(
-                f"CREATE DATABASE IF NOT EXISTS `{DB_NAME}` "
+                f"CREATE DATABASE IF NOT EXISTS `{name}` "
                 "DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
             )
         )
@@ -61,18 +239,54 @@ def _add_col_if_missing(conn, table, col, ddl):
         text(
             """
             SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA=:db AND TABLE_NAME=:tbl AND COLUMN_NAME=:col
+            WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=:tbl AND COLUMN_NAME=:col
             """
         ),
-        {"db": DB_NAME, "tbl": table, "col": col},
+        {"tbl": table, "col": col},
     ).scalar()
     if not present:
         conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
 
 
+def _add_index_if_missing(conn, table, name, cols, unique=False):
+    """Crea un índice si no existe (MySQL no tiene CREATE INDEX IF NOT EXISTS)."""
+    present = conn.execute(
+        text(
+            """
+            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=:tbl AND INDEX_NAME=:idx
+            """
+        ),
+        {"tbl": table, "idx": name},
+    ).scalar()
+    if not present:
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({cols})"))
+
+
 def create_tables_if_needed():
     """Crea todas las tablas requeridas si no existen."""
     with engine().begin() as conn:
+        # Colegios. Sin FK desde users/responses: en una base propia
+        # (tenants.db_url) el id del colegio no existe en esta tabla.
+        conn.execute(
+            text(
+                """
+                CREATE TABLE IF NOT EXISTS tenants (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    code VARCHAR(64) NOT NULL UNIQUE,
+                    name VARCHAR(150) NOT NULL,
+                    db_url VARCHAR(512) NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+                """
+            )
+        )
+        conn.execute(
+            text("INSERT IGNORE INTO tenants (id, code, name) VALUES (:id, 'default', 'Colegio principal')"),
+            {"id": DEFAULT_TENANT},
+        )
+
         # Usuarios
         conn.execute(
             text(
@@ -89,8 +303,13 @@ def create_tables_if_needed():
             )
         )
         # Evoluciones opcionales
+        # sha256 del código para registrarse en el colegio (NULL: registro cerrado)
+        _add_col_if_missing(conn, "tenants", "join_hash", "join_hash CHAR(64) NULL AFTER db_url")
         _add_col_if_missing(conn, "users", "gender", "gender ENUM('M','F') NULL AFTER password_hash")
         _add_col_if_missing(conn, "users", "age", "age TINYINT UNSIGNED NULL AFTER gender")
+        _add_col_if_missing(conn, "users", "tenant_id",
+                            f"tenant_id INT NOT NULL DEFAULT {DEFAULT_TENANT} AFTER role")
+        _add_index_if_missing(conn, "users", "ix_users_tenant_role", "tenant_id, role, fullname")
         _add_col_if_missing(conn, "surveys", "description", "description VARCHAR(255) NULL AFTER title")
         _add_col_if_missing(conn, "surveys", "min_age",    "min_age TINYINT UNSIGNED NOT NULL AFTER description")
         _add_col_if_missing(conn, "surveys", "max_age",    "max_age TINYINT UNSIGNED NOT NULL AFTER min_age")
@@ -155,6 +374,28 @@ def create_tables_if_needed():
                 """
             )
         )
+        # Subescalas en la cabecera: el detalle por ítem puede archivarse
+        # (app/archive.py) sin perder las features del modelo ni los agregados
+        for col in ("gad", "soc", "ocd", "paa", "phb", "sad"):
+            _add_col_if_missing(conn, "responses", col, f"{col} SMALLINT UNSIGNED NULL")
+        _add_col_if_missing(conn, "responses", "archived_at", "archived_at TIMESTAMP NULL")
+        # Sin detalle del que recalcular subescalas: el backfill no las vuelve a intentar
+        _add_col_if_missing(conn, "responses", "scores_missing",
+                            "scores_missing TINYINT(1) NOT NULL DEFAULT 0")
+        _add_index_if_missing(conn, "responses", "ix_resp_pending_scores", "gad, scores_missing")
+        # Multi-colegio: las consultas del panel empiezan por el colegio
+        _add_col_if_missing(conn, "responses", "tenant_id",
+                            f"tenant_id INT NOT NULL DEFAULT {DEFAULT_TENANT} AFTER user_id")
+        _add_index_if_missing(conn, "responses", "ix_resp_tenant_survey_user",
+                              "tenant_id, survey_id, user_id, created_at")
+        # Historial por alumno (app/history.py): filtro y orden salen del índice
+        _add_index_if_missing(conn, "responses", "ix_resp_user_survey_created",
+                              "user_id, survey_id, created_at")
+        # Envíos offline reintentados: el cliente manda un client_ref por intento
+        # y el índice único (NULL no colisiona) garantiza que se guarde una vez
+        _add_col_if_missing(conn, "responses", "client_ref", "client_ref VARCHAR(40) NULL")
+        _add_index_if_missing(conn, "responses", "ux_resp_user_client_ref",
+                              "user_id, client_ref", unique=True)
 
         # Respuestas por ítem (detalle)
         conn.execute(
@@ -179,6 +420,92 @@ def create_tables_if_needed():
             )
         )
 
+        # Respuestas empaquetadas (2 bits x 44 ítems = 11 bytes, ver app/packing.py)
+        _add_col_if_missing(conn, "responses", "answers_packed", "answers_packed BINARY(11) NULL")
+        # Bit por ítem respondido; NULL = los 44 (así un 0 no se confunde con "sin respuesta")
+        _add_col_if_missing(conn, "responses", "answers_mask", "answers_mask BINARY(6) NULL")
+
+        # Vista de compatibilidad: filas por ítem tanto del formato clásico
+        # como desempaquetadas de responses.answers_packed (solo las respondidas)
+        conn.execute(
+            text(
+                """
+                CREATE OR REPLACE VIEW v_response_items AS
+                SELECT ri.response_id, ri.item_id, ri.value
+                FROM response_items ri
+                UNION ALL
+                SELECT r.id, si.id,
+                       (ASCII(SUBSTRING(r.answers_packed, ((si.item_number - 1) DIV 4) + 1, 1))
+                         >> (6 - 2 * ((si.item_number - 1) MOD 4))) & 3
+                FROM responses r
+                JOIN survey_items si
+                  ON si.survey_id = r.survey_id AND si.item_number BETWEEN 1 AND 44
+                WHERE r.answers_packed IS NOT NULL
+                  AND (r.answers_mask IS NULL OR
+                       (ASCII(SUBSTRING(r.answers_mask, ((si.item_number - 1) DIV 8) + 1, 1))
+                         >> (7 - (si.item_number - 1) MOD 8)) & 1)
+                  AND NOT EXISTS (SELECT 1 FROM response_items x WHERE x.response_id = r.id)
+                """
+            )
+        )
+
+
+BACKFILL_BATCH = 1000
+
+_PENDING_SCORES = text(
+    """
+    SELECT id FROM responses
+    WHERE gad IS NULL AND scores_missing = 0 AND archived_at IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :lim
+    """
+)
+
+# Solo agrega el detalle de las respuestas pendientes (no toda response_items)
+_FILL_SCORES = text(
+    """
+    UPDATE responses r
+    JOIN (
+        SELECT ri.response_id,
+          SUM(CASE WHEN si.is_scored AND si.subscale='GAD' THEN ri.value ELSE 0 END) AS gad,
+          SUM(CASE WHEN si.is_scored AND si.subscale='SOC' THEN ri.value ELSE 0 END) AS soc,
+          SUM(CASE WHEN si.is_scored AND si.subscale='OCD' THEN ri.value ELSE 0 END) AS ocd,
+          SUM(CASE WHEN si.is_scored AND si.subscale='PAA' THEN ri.value ELSE 0 END) AS paa,
+          SUM(CASE WHEN si.is_scored AND si.subscale='PHB' THEN ri.value ELSE 0 END) AS phb,
+          SUM(CASE WHEN si.is_scored AND si.subscale='SAD' THEN ri.value ELSE 0 END) AS sad
+        FROM response_items ri
+        JOIN survey_items si ON si.id = ri.item_id
+        WHERE ri.response_id IN :ids
+        GROUP BY ri.response_id
+    ) x ON x.response_id = r.id
+    SET r.gad=x.gad, r.soc=x.soc, r.ocd=x.ocd, r.paa=x.paa, r.phb=x.phb, r.sad=x.sad
+    WHERE r.id IN :ids AND r.gad IS NULL
+    """
+).bindparams(bindparam("ids", expanding=True))
+
+_MARK_MISSING = text(
+    "UPDATE responses SET scores_missing = 1 WHERE id IN :ids AND gad IS NULL"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def backfill_response_scores():
+    """
+    Completa las subescalas de respuestas antiguas a partir de response_items,
+    por bloques de ids pendientes. Las que no tienen detalle se marcan
+    (scores_missing) para no volver a buscarlas en cada arranque.
+    """
+    after = 0
+    while True:
+        with engine().begin() as conn:
+            ids = [r[0] for r in conn.execute(_PENDING_SCORES, {"after": after, "lim": BACKFILL_BATCH})]
+            if not ids:
+                return
+            conn.execute(_FILL_SCORES, {"ids": ids})
+            missing = conn.execute(_MARK_MISSING, {"ids": ids}).rowcount
+        if missing:
+            print(f"[DB] backfill: {missing} respuestas sin detalle, marcadas scores_missing")
+        after = ids[-1]
+
 
 def ensure_admin():
     """Crea un admin por defecto si no existe."""
@@ -198,29 +525,56 @@ def ensure_admin():
                     VALUES (:n, :e, 'admin', :ph)
                     """
                 ),
-                {"n": admin_name, "e": admin_email, "ph": bcrypt.hash(admin_pass)},
+                {"n": admin_name, "e": admin_email, "ph": hash_password(admin_pass)},
             )
 
 
 # ----------------------------
 # Helpers de acceso
 # ----------------------------
-def db_one(q, params=None):
-    """Devuelve un dict (o None)."""
-    with engine().connect() as conn:
-        row = conn.execute(text(q), params or {}).mappings().first()
-        return dict(row) if row else None
+def _stmt(q):
+    """Acepta SQL plano o un text() ya armado (p. ej. con bindparam expanding)."""
+    return text(q) if isinstance(q, str) else q
+
+
+def _execute(conn, q, params):
+    """Sentencia registrada (app/statements.py), text() o SQL plano."""
+    if isinstance(q, Statement):
+        return q.execute(conn, params)
+    return conn.execute(_stmt(q), params or {})
+
 
+def _observe(q, dt, name):
+    metrics.observe("db.query", dt, engine=name)
+    if isinstance(q, Statement):
+        metrics.observe("db.stmt", dt, stmt=q.name)
 
-def db_all(q, params=None):
-    """Devuelve lista de dicts."""
-    with engine().connect() as conn:
-        rows = conn.execute(text(q), params or {}).mappings().all()
-        return [dict(r) for r in rows]
+
+def db_one(q, params=None, primary=False):
+    """Devuelve un dict (o None). Lee de la réplica salvo `primary=True`."""
+    eng, name = _read_target(primary)
+    t0 = time.perf_counter()
+    with eng.connect() as conn:
+        row = _execute(conn, q, params).mappings().first()
+    _observe(q, time.perf_counter() - t0, name)
+    return dict(row) if row else None
+
+
+def db_all(q, params=None, primary=False):
+    """Devuelve lista de dicts. Lee de la réplica salvo `primary=True`."""
+    eng, name = _read_target(primary)
+    t0 = time.perf_counter()
+    with eng.connect() as conn:
+        rows = _execute(conn, q, params).mappings().all()
+    _observe(q, time.perf_counter() - t0, name)
+    return [dict(r) for r in rows]
 
 
 def db_exec(q, params=None):
-    """Ejecuta DML (INSERT/UPDATE/DELETE) confirmando la transacción."""
-    with engine().begin() as conn:
-        res = conn.execute(text(q), params or {})
-        return res.rowcount  # filas afectadas
+    """Ejecuta DML (INSERT/UPDATE/DELETE) confirmando la transacción (siempre en la primaria)."""
+    eng, name = _write_target()
+    t0 = time.perf_counter()
+    with eng.begin() as conn:
+        res = _execute(conn, q, params)
+    _observe(q, time.perf_counter() - t0, name)
+    return res.rowcount  # filas afectadas
@@ -0,0 +1,121 @@
+# app/events.py
+"""
+Broker de eventos en proceso para el panel admin (server-sent events).
+
+Cada sesión admin conectada a /api/admin/stream recibe una cola acotada;
+`scas_submit` publica un delta pequeño por intento y el panel lo aplica sin
+volver a pedir la lista completa. Si un suscriptor lento llena su cola se
+descarta lo más viejo y se le avisa con un evento `resync` para que recargue.
+
+Nota: el broker vive en memoria del worker; con varios workers de gunicorn
+cada panel ve los envíos atendidos por su propio worker. El panel recarga la
+lista completa cada vez que el stream se reabre (admin.html, `onopen` tras
+la primera conexión), lo que cubre los intentos hechos mientras estuvo caído. Cada suscripción pertenece a un colegio y solo
+recibe los eventos de ese colegio.
+"""
+from __future__ import annotations
+
+import json
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .tenancy import current_tenant
+
+BUFFER_SIZE = 100  # eventos pendientes por suscriptor
+
+
+class Subscription:
+    def __init__(self, maxsize: int, tenant: Optional[int] = None):
+        self.tenant = tenant
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._lock = threading.Lock()  # `dropped` lo tocan publicador y suscriptor
+
+    def mark_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Siguiente evento o None si vence `timeout`."""
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            return {"type": "resync"}
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    def __init__(self, buffer_size: int = BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subs: set = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, tenant: Optional[int] = None) -> Subscription:
+        sub = Subscription(self.buffer_size, tenant)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, event: Dict[str, Any], tenant: Optional[int] = None) -> None:
+        """Entrega a los suscriptores de `tenant` (None: a todos)."""
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            if tenant is not None and sub.tenant is not None and sub.tenant != tenant:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                # Suscriptor lento: descarta el más viejo y marca para resync
+                try:
+                    sub.queue.get_nowait()
+                except queue.Empty:
+                    pass
+                sub.mark_dropped()
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    pass
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+
+broker = Broker()
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serializa un evento al formato text/event-stream."""
+    data = json.dumps(event, default=str, ensure_ascii=False)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
+
+
+def publish_attempt(user: Dict[str, Any], total: int, level: Optional[str],
+                    created_at: datetime, first_attempt: bool) -> None:
+    """Delta de un intento nuevo: fila del alumno + contadores."""
+    broker.publish({
+        "type": "attempt",
+        "user_id": user["id"],
+        "fullname": user.get("fullname"),
+        "email": user.get("email"),
+        "score": total,
+        "level": level,
+        "created_at": created_at.isoformat(timespec="seconds") + "Z",
+        "first_attempt": first_attempt,
+        "counters": {"attempts": 1},
+    }, tenant=user.get("tenant_id") or current_tenant())
+
+
+def publish_resync(tenant: Optional[int] = None) -> None:
+    """Pide a los paneles recargar la lista completa (p. ej. tras una importación)."""
+    broker.publish({"type": "resync"}, tenant=tenant)
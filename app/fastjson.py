@@ -0,0 +1,73 @@
+# app/fastjson.py
+"""
+Proveedor JSON de la app: usa orjson si está instalado (mucho más rápido en
+listas grandes como /api/admin/students) y cae al encoder estándar si no.
+
+En ambos caminos:
+- datetime naive se asume UTC (así los guarda MySQL en esta app) y sale en
+  ISO 8601 con sufijo Z, p. ej. "2025-03-01T10:15:00Z".
+- Decimal (AVG/ROUND de MySQL) sale como número, no como string.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # opcional
+    orjson = None
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(o: Any) -> Any:
+    if isinstance(o, datetime):
+        if o.tzinfo is None:
+            o = o.replace(tzinfo=timezone.utc)
+        return o.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return int(o) if o == o.to_integral_value() else float(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if isinstance(o, bytes):
+        return o.decode("utf-8", "replace")
+    return DefaultJSONProvider.default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def _fast(self, obj: Any) -> bytes | None:
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+        except TypeError:  # p. ej. enteros > 64 bits: usa el camino estándar
+            return None
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if not kwargs:
+            raw = self._fast(obj)
+            if raw is not None:
+                return raw.decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        raw = self._fast(obj)
+        if raw is None:
+            raw = super().dumps(obj).encode("utf-8")
+        return self._app.response_class(raw + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,81 @@
+# app/history.py
+"""
+Historial de intentos SCAS por alumno con su tendencia.
+
+La consulta recorre el índice (user_id, survey_id, created_at) de un solo
+alumno y calcula en SQL, con funciones de ventana, la variación respecto al
+intento anterior y la media móvil de los últimos 3 totales. Se pagina por
+keyset: `before` es el id del último intento de la página anterior y la
+página siguiente son los intentos estrictamente anteriores a él en
+(created_at, id). Sin caché: cada página sale de la primaria, así el
+intento recién enviado aparece aunque lo haya atendido otro worker.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from .db import db_all
+from .statements import statement
+from .utils import level_from_score
+
+MOVING_WINDOW = 3
+PAGE_DEFAULT = 20
+PAGE_MAX = 100
+
+# La ventana se calcula sobre todo el historial del alumno (pocas filas, vía
+# índice) y luego se corta la página; si no, el primer intento de cada página
+# perdería su delta y su media móvil
+_SELECT = statement("history.by_user", f"""
+    SELECT t.* FROM (
+        SELECT r.id, r.created_at, r.total_score AS total,
+               r.gad, r.soc, r.ocd, r.paa, r.phb, r.sad,
+               r.total_score - LAG(r.total_score) OVER w AS delta,
+               AVG(r.total_score) OVER (w ROWS BETWEEN {MOVING_WINDOW - 1} PRECEDING AND CURRENT ROW)
+                   AS moving_avg,
+               COUNT(*) OVER () AS n
+        FROM responses r
+        WHERE r.user_id = :uid
+          AND r.survey_id = (SELECT id FROM surveys WHERE code='SCAS_CHILD')
+        WINDOW w AS (ORDER BY r.created_at, r.id)
+    ) t
+    WHERE :before IS NULL
+       OR (t.created_at, t.id) < (SELECT b.created_at, b.id FROM responses b
+                                  WHERE b.id = :before AND b.user_id = :uid)
+    ORDER BY t.created_at DESC, t.id DESC
+    LIMIT :lim
+""")
+
+
+def _attempt(r) -> Dict[str, Any]:
+    return {
+        "id": r["id"],
+        "created_at": r["created_at"],
+        "total": r["total"],
+        "level": level_from_score(r["total"]),
+        "subscales": {k.upper(): r[k] for k in ("gad", "soc", "ocd", "paa", "phb", "sad")},
+        "delta": r["delta"],
+        "moving_avg": round(float(r["moving_avg"]), 2) if r["moving_avg"] is not None else None,
+    }
+
+
+def page_args(args):
+    """(before, limit) desde el query string; ValueError si no son enteros."""
+    before = args.get("before")
+    return (int(before) if before else None), int(args.get("limit") or PAGE_DEFAULT)
+
+
+def page(uid: int, before: Optional[int] = None, limit: int = PAGE_DEFAULT) -> Dict[str, Any]:
+    """
+    Intentos del más reciente al más antiguo:
+    { attempts: [...], count, next_before }  (next_before=None en la última página)
+    """
+    limit = max(1, min(limit, PAGE_MAX))
+    # Primaria: justo después de enviar, la réplica podría no tener el intento.
+    # Se pide una fila de más para saber si hay otra página.
+    rows = db_all(_SELECT, {"uid": uid, "before": before, "lim": limit + 1}, primary=True)
+    chunk = [_attempt(r) for r in rows[:limit]]
+    return {
+        "attempts": chunk,
+        "count": int(rows[0]["n"]) if rows else 0,
+        "next_before": chunk[-1]["id"] if len(rows) > limit else None,
+    }
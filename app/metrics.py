@@ -0,0 +1,52 @@
+# app/metrics.py
+"""
+Métricas en memoria del proceso: contadores y tiempos con etiquetas.
+Se exponen (solo admin) en GET /api/admin/metrics.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Tuple
+
+_Key = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[_Key, int] = {}
+_timings: Dict[_Key, list] = {}   # [count, total_s, max_s]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: int = 1, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def observe(name: str, seconds: float, **labels: Any) -> None:
+    k = _key(name, labels)
+    with _lock:
+        t = _timings.get(k)
+        if t is None:
+            _timings[k] = [1, seconds, seconds]
+        else:
+            t[0] += 1
+            t[1] += seconds
+            if seconds > t[2]:
+                t[2] = seconds
+
+
+def snapshot() -> Dict[str, list]:
+    """{ nombre: [{labels..., value}] } para contadores y {count, total_ms, max_ms} para tiempos."""
+    out: Dict[str, list] = {}
+    with _lock:
+        for (name, labels), v in _counters.items():
+            out.setdefault(name, []).append({**dict(labels), "value": v})
+        for (name, labels), (n, total, mx) in _timings.items():
+            out.setdefault(name, []).append({
+                **dict(labels), "count": n,
+                "total_ms": round(total * 1000, 3), "max_ms": round(mx * 1000, 3),
+            })
+    return out
@@ -7,6 +7,8 @@ from typing import Dict, Any, Tuple, Optional, List
 from sklearn.linear_model import LogisticRegression
 
 from .db import db_all  # asumimos helpers db_all/db_one como en tus otros módulos
+from .snapshot import open_snapshot
+from .statements import statement
 
 BASE_DIR   = Path(__file__).resolve().parent
 MODEL_PATH = BASE_DIR / "scas_model.joblib"
@@ -14,6 +16,18 @@ CLASSES    = ["Bajo", "Moderado", "Alto"]  # orden fijo
 
 FEATURES = ["total", "GAD", "SOC", "OCD", "PAA", "PHB", "SAD"]
 
+# Las subescalas viven en la cabecera (responses.gad..sad), así que no hace
+# falta recorrer response_items (que además puede estar archivado).
+_DATASET = statement("ml.dataset", """
+  SELECT
+    r.total_score AS total,
+    r.gad AS GAD, r.soc AS SOC, r.ocd AS OCD, r.paa AS PAA, r.phb AS PHB, r.sad AS SAD
+  FROM responses r
+  JOIN surveys s ON s.id = r.survey_id AND s.code='SCAS_CHILD'
+  WHERE r.gad IS NOT NULL
+  ORDER BY r.created_at ASC
+""")
+
 def _score_to_label(total: int) -> str:
     if total >= 76: return "Alto"
     if total >= 38: return "Moderado"
@@ -25,30 +39,14 @@ def _fetch_dataset() -> Tuple[np.ndarray, np.ndarray]:
     X columnas = [total, GAD, SOC, OCD, PAA, PHB, SAD]
     y = label por umbrales (Bajo/Moderado/Alto) – puedes reemplazarlo por etiquetas clínicas en el futuro.
     """
-    rows = db_all("""
-      WITH sub AS (
-        SELECT
-          r.id AS response_id,
-          SUM(CASE WHEN si.subscale='GAD' THEN ri.value ELSE 0 END) AS GAD,
-          SUM(CASE WHEN si.subscale='SOC' THEN ri.value ELSE 0 END) AS SOC,
-          SUM(CASE WHEN si.subscale='OCD' THEN ri.value ELSE 0 END) AS OCD,
-          SUM(CASE WHEN si.subscale='PAA' THEN ri.value ELSE 0 END) AS PAA,
-          SUM(CASE WHEN si.subscale='PHB' THEN ri.value ELSE 0 END) AS PHB,
-          SUM(CASE WHEN si.subscale='SAD' THEN ri.value ELSE 0 END) AS SAD
-        FROM responses r
-        JOIN response_items ri ON ri.response_id = r.id
-        JOIN survey_items si   ON si.id = ri.item_id
-        JOIN surveys s         ON s.id = r.survey_id AND s.code='SCAS_CHILD'
-        GROUP BY r.id
-      )
-      SELECT
-        r.total_score AS total,
-        sub.GAD, sub.SOC, sub.OCD, sub.PAA, sub.PHB, sub.SAD
-      FROM responses r
-      JOIN surveys s ON s.id = r.survey_id AND s.code='SCAS_CHILD'
-      JOIN sub      ON sub.response_id = r.id
-      ORDER BY r.created_at ASC;
-    """)
+    snap = open_snapshot()
+    if snap is not None and len(snap["total"]):
+        # Snapshot columnar mapeado en memoria: sin consulta ni listas de dicts
+        X = np.column_stack([snap["total"]] + [snap[k.lower()] for k in FEATURES[1:]]).astype(float)
+        y = np.digitize(snap["total"], [38, 76])  # 0=Bajo, 1=Moderado, 2=Alto (_score_to_label)
+        return X, y.astype(int)
+
+    rows = db_all(_DATASET)
     if not rows:
         return np.empty((0, len(FEATURES))), np.empty((0,), dtype=int)
 
@@ -0,0 +1,203 @@
+# app/neighbors.py
+"""
+Índice en memoria de perfiles similares (k vecinos más cercanos).
+
+Cada alumno es un punto de 6 dimensiones: sus subescalas del último intento
+divididas por el máximo de cada una (así PAA, con más ítems, no pesa más).
+La base es un cKDTree construido con los datos guardados (snapshot + cola,
+ver analytics.load_columns). Los envíos nuevos no tocan el árbol: el punto
+viejo del alumno queda marcado como borrado y el nuevo va a un buffer delta
+que se recorre por fuerza bruta. Cuando el delta crece (REBUILD_DELTA) o el
+índice envejece (REBUILD_SECONDS, cubre envíos atendidos por otros workers)
+se reconstruye en segundo plano del request que lo detecta.
+
+Hay un índice por colegio (`for_tenant`), así que cada uno cuesta según
+sus propios alumnos. `brute()` calcula lo mismo sin árbol: sirve para
+validar y comparar.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .analytics import SCALE_MAX, latest_mask, load_columns, user_attrs
+from .tenancy import current_tenant, use_tenant
+
+SUBSCALES = ("gad", "soc", "ocd", "paa", "phb", "sad")
+_SCALE = np.array([SCALE_MAX[s] for s in SUBSCALES], dtype=np.float64)
+
+REBUILD_DELTA = int(os.getenv("NEIGHBORS_REBUILD_DELTA", "500"))
+REBUILD_SECONDS = float(os.getenv("NEIGHBORS_REBUILD_SECONDS", "600"))
+
+
+def vectorize(subs: Dict[str, int]) -> np.ndarray:
+    """{"GAD": 7, ...} (o minúsculas) -> vector normalizado (6,)."""
+    raw = [subs.get(s.upper(), subs.get(s, 0)) or 0 for s in SUBSCALES]
+    return np.asarray(raw, dtype=np.float64) / _SCALE
+
+
+class _State:
+    """Árbol inmutable + cambios posteriores a su construcción."""
+
+    def __init__(self, ids: np.ndarray, X: np.ndarray):
+        self.ids = ids
+        self.X = X
+        self.tree = cKDTree(X) if len(X) else None
+        self.row = {int(u): i for i, u in enumerate(ids)}
+        self.dead: set = set()                  # filas del árbol reemplazadas
+        self.delta: Dict[int, np.ndarray] = {}  # uid -> vector nuevo
+        self.built_at = time.monotonic()
+
+    def apply(self, uid: int, vec: np.ndarray) -> None:
+        row = self.row.get(uid)
+        if row is not None:
+            self.dead.add(row)
+        self.delta[uid] = vec
+
+    def vector(self, uid: int) -> Optional[np.ndarray]:
+        if uid in self.delta:
+            return self.delta[uid]
+        row = self.row.get(uid)
+        return None if row is None else self.X[row]
+
+    def stale(self) -> bool:
+        return (len(self.delta) > REBUILD_DELTA
+                or time.monotonic() - self.built_at > REBUILD_SECONDS)
+
+
+def _load(tid: int) -> _State:
+    with use_tenant(tid):  # también desde el hilo de reconstrucción
+        cols = load_columns()
+        uid = cols["user_id"].astype(np.int64)
+        if not len(uid):
+            return _State(uid, np.empty((0, len(SUBSCALES))))
+        member = user_attrs(uid)[0]
+    last = latest_mask(uid, cols["ts"], cols["response_id"]) & member
+    X = np.column_stack([cols[s][last] for s in SUBSCALES]).astype(np.float64) / _SCALE
+    return _State(uid[last], X)
+
+
+class NeighborIndex:
+    def __init__(self, tenant: int):
+        self.tenant = tenant
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._state: Optional[_State] = None
+        self._replay: Optional[List[Tuple[int, np.ndarray]]] = None  # cambios durante un rebuild
+
+    # ---- mantenimiento ----
+    def rebuild(self, wait: bool = True) -> None:
+        if not self._build_lock.acquire(blocking=wait):
+            return  # ya hay otro hilo reconstruyendo
+        try:
+            if wait and self._state is not None and not self._state.stale():
+                return  # lo reconstruyó otro hilo mientras esperábamos
+            with self._lock:
+                self._replay = []
+            state = None
+            try:
+                state = _load(self.tenant)
+            finally:
+                with self._lock:
+                    replay, self._replay = self._replay, None
+                    if state is not None:
+                        for uid, vec in replay:
+                            state.apply(uid, vec)
+                        self._state = state
+        finally:
+            self._build_lock.release()
+
+    def update(self, uid: int, subs: Dict[str, int]) -> None:
+        """Nuevo último intento de `uid` (llamar tras cada envío)."""
+        vec = vectorize(subs)
+        with self._lock:
+            if self._state is not None:
+                self._state.apply(uid, vec)
+            if self._replay is not None:
+                self._replay.append((uid, vec))
+
+    def invalidate(self) -> None:
+        """Fuerza reconstrucción en la próxima consulta (p. ej. tras importar)."""
+        with self._lock:
+            if self._state is not None:
+                self._state.built_at = float("-inf")
+
+    def _current(self) -> _State:
+        state = self._state
+        if state is None:
+            self.rebuild()
+        elif state.stale():
+            threading.Thread(target=self.rebuild, args=(False,),
+                             name="neighbors-rebuild", daemon=True).start()
+        return self._state
+
+    # ---- consultas ----
+    def similar(self, uid: int, k: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """[(uid, distancia)] de los k perfiles más cercanos, o None si `uid` no tiene intentos."""
+        state = self._current()
+        with self._lock:
+            x = state.vector(uid)
+            if x is None:
+                return None
+            dead = set(state.dead)
+            delta = dict(state.delta)
+        out: Dict[int, float] = {}
+
+        if state.tree is not None:
+            # Pedir de más para cubrir el propio alumno y las filas borradas
+            kk = min(k + 1 + len(dead), len(state.ids))
+            dist, idx = state.tree.query(x, k=kk)
+            for d, i in zip(np.atleast_1d(dist), np.atleast_1d(idx)):
+                if i in dead:
+                    continue
+                out[int(state.ids[i])] = float(d)
+
+        if delta:
+            ids = np.fromiter(delta, dtype=np.int64, count=len(delta))
+            D = np.linalg.norm(np.stack(list(delta.values())) - x, axis=1)
+            for u, d in zip(ids.tolist(), D.tolist()):
+                out[u] = d
+
+        out.pop(uid, None)
+        return sorted(out.items(), key=lambda t: (t[1], t[0]))[:k]
+
+    def brute(self, uid: int, k: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """Misma respuesta que `similar`, comparando contra todos los alumnos."""
+        state = self._current()
+        with self._lock:
+            x = state.vector(uid)
+            if x is None:
+                return None
+            alive = np.ones(len(state.ids), dtype=bool)
+            alive[list(state.dead)] = False
+            ids = np.concatenate([state.ids[alive],
+                                  np.fromiter(state.delta, dtype=np.int64, count=len(state.delta))])
+            X = np.concatenate([state.X[alive],
+                                np.stack(list(state.delta.values())) if state.delta
+                                else np.empty((0, len(SUBSCALES)))])
+        keep = ids != uid
+        ids, X = ids[keep], X[keep]
+        if not len(ids):
+            return []
+        D = np.linalg.norm(X - x, axis=1)
+        top = np.argpartition(D, min(k, len(D) - 1))[:k]
+        return sorted(zip(ids[top].tolist(), D[top].tolist()), key=lambda t: (t[1], t[0]))
+
+
+_indexes: Dict[int, NeighborIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def for_tenant(tid: Optional[int] = None) -> NeighborIndex:
+    """Índice del colegio `tid` (por defecto el del request)."""
+    tid = current_tenant() if tid is None else tid
+    with _indexes_lock:
+        ix = _indexes.get(tid)
+        if ix is None:
+            ix = _indexes[tid] = NeighborIndex(tid)
+        return ix
@@ -0,0 +1,50 @@
+# app/offload.py
+"""
+Trabajo de CPU fuera del bucle de requests.
+
+En modo asíncrono (gunicorn con worker gevent, ver gunicorn.conf.py) cada
+request es un greenlet y el acceso a MySQL con PyMySQL cede el control
+mientras espera la red; lo único que bloquearía al proceso entero es CPU
+pura (bcrypt, modelo ML). Estas funciones la mandan a hilos nativos del
+threadpool de gevent. En modo sync se ejecuta directo, como siempre.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+
+_cpu: Optional[Executor] = None
+_cpu_lock = threading.Lock()
+
+
+def gevent_active() -> bool:
+    """True si el proceso corre con threading parcheado por gevent."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def native_executor(max_workers: int, name: str) -> Executor:
+    """Pool de hilos del sistema operativo también bajo gevent."""
+    if gevent_active():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+
+def run_cpu(fn: Callable[..., Any], *args: Any) -> Any:
+    """Ejecuta `fn(*args)`; bajo gevent en un hilo nativo para no frenar el hub."""
+    global _cpu
+    if not gevent_active():
+        return fn(*args)
+    if _cpu is None:
+        with _cpu_lock:
+            if _cpu is None:
+                _cpu = native_executor(CPU_WORKERS, "cpu")
+    return _cpu.submit(fn, *args).result()
@@ -0,0 +1,119 @@
+# app/packing.py
+"""
+Almacenamiento compacto de las 44 respuestas de un intento.
+
+Cada respuesta vale 0..3, así que cabe en 2 bits: el vector completo ocupa
+11 bytes (4 ítems por byte, ítem 1 en los bits altos del primer byte) y se
+guarda en responses.answers_packed. Un 0 empaquetado no distingue "no
+respondió" de "Nunca": si faltó algún ítem, responses.answers_mask guarda
+un bit por ítem respondido (6 bytes, ítem 1 en el bit alto); NULL = los 44
+respondidos. La vista v_response_items sigue presentando filas
+(response_id, item_id, value), solo de los ítems respondidos.
+
+ANSWER_STORAGE elige cómo se escribe cada intento nuevo:
+- "rows" (defecto): solo response_items, 44 filas (formato original, el que
+  leen el detalle del panel, la exportación del modelo y las consultas);
+- "both": ambos (útil mientras se migra algún consumidor);
+- "packed": solo la columna empaquetada, una fila por intento (opt-in,
+  cuando todo lo que lee response_items usa ya v_response_items).
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+N_ITEMS = 44
+PACKED_BYTES = N_ITEMS // 4  # 11
+MASK_BYTES = (N_ITEMS + 7) // 8  # 6
+
+ANSWER_STORAGE = os.getenv("ANSWER_STORAGE", "rows").lower()
+if ANSWER_STORAGE not in ("packed", "rows", "both"):
+    raise ValueError(f"ANSWER_STORAGE inválido: {ANSWER_STORAGE}")
+
+WRITE_PACKED = ANSWER_STORAGE in ("packed", "both")
+WRITE_ROWS = ANSWER_STORAGE in ("rows", "both")
+
+_SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def encode_answers(values: Sequence[int]) -> bytes:
+    """44 valores 0..3 (en orden de ítem 1..44) -> 11 bytes."""
+    a = np.asarray(values, dtype=np.uint8)
+    if a.shape != (N_ITEMS,):
+        raise ValueError(f"se esperan {N_ITEMS} valores")
+    if a.max(initial=0) > 3:
+        raise ValueError("valores fuera de rango 0..3")
+    return (a.reshape(PACKED_BYTES, 4) << _SHIFTS).sum(axis=1, dtype=np.uint8).tobytes()
+
+
+def encode_mask(answered: Sequence[bool]) -> Optional[bytes]:
+    """44 banderas (ítem respondido) -> 6 bytes, o None si están todos."""
+    a = np.asarray(answered, dtype=bool)
+    if a.shape != (N_ITEMS,):
+        raise ValueError(f"se esperan {N_ITEMS} banderas")
+    return None if a.all() else np.packbits(a).tobytes()
+
+
+def decode_mask(blob: Optional[bytes]) -> np.ndarray:
+    """answers_mask -> array bool (44,) de ítems respondidos (None = todos)."""
+    if blob is None:
+        return np.ones(N_ITEMS, dtype=bool)
+    return np.unpackbits(np.frombuffer(blob, dtype=np.uint8), count=N_ITEMS).astype(bool)
+
+
+def encode_by_number(answers: Dict[int, int]) -> Tuple[bytes, Optional[bytes]]:
+    """
+    {item_number: valor} -> (11 bytes de valores, máscara de respondidos o
+    None si están los 44). Los ítems ausentes valen 0 en los valores.
+    """
+    values = [0] * N_ITEMS
+    answered = [False] * N_ITEMS
+    for n, v in answers.items():
+        if 1 <= n <= N_ITEMS:
+            values[n - 1] = v
+            answered[n - 1] = True
+    return encode_answers(values), encode_mask(answered)
+
+
+def decode_answers(blob: bytes) -> np.ndarray:
+    """11 bytes -> array uint8 (44,) (combinar con decode_mask para los faltantes)."""
+    return decode_many([blob])[0]
+
+
+def decode_many(blobs: Iterable[bytes]) -> np.ndarray:
+    """Varios vectores empaquetados -> matriz uint8 (n, 44), sin bucles Python por ítem."""
+    buf = b"".join(blobs)
+    if len(buf) % PACKED_BYTES:
+        raise ValueError("longitud de datos empaquetados inválida")
+    packed = np.frombuffer(buf, dtype=np.uint8).reshape(-1, PACKED_BYTES)
+    return ((packed[:, :, None] >> _SHIFTS) & 3).reshape(-1, N_ITEMS)
+
+
+def pack_normalized(normalized: Iterable[Tuple[int, int]], items: dict) -> Tuple[bytes, Optional[bytes]]:
+    """[(item_id, valor)] + metadatos de scas_meta()['items'] -> (valores, máscara)."""
+    return encode_by_number({
+        items[iid]["item_number"]: val for iid, val in normalized if iid in items
+    })
+
+
+def fetch_answer_matrix():
+    """
+    (response_ids, valores (n, 44), respondidos (n, 44) bool) de todos los
+    intentos guardados empaquetados.
+    """
+    from .db import db_all
+
+    rows = db_all(
+        """
+        SELECT id, answers_packed, answers_mask FROM responses
+        WHERE answers_packed IS NOT NULL ORDER BY id
+        """
+    )
+    ids = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=len(rows))
+    answered = np.ones((len(rows), N_ITEMS), dtype=bool)
+    for i, r in enumerate(rows):
+        if r["answers_mask"] is not None:
+            answered[i] = decode_mask(r["answers_mask"])
+    return ids, decode_many(r["answers_packed"] for r in rows), answered
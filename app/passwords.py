@@ -0,0 +1,71 @@
+# app/passwords.py
+"""
+Hashing de contraseñas (bcrypt) fuera del hilo del request.
+
+- Costo configurable con BCRYPT_ROUNDS (por defecto 12, el de passlib).
+- Se ejecuta en un pool acotado (BCRYPT_WORKERS hilos; bcrypt libera el GIL)
+  con una cola máxima (BCRYPT_QUEUE). Si el pool está saturado se lanza
+  HashPoolBusy de inmediato para responder 503 en vez de apilar requests;
+  lo mismo si el hash no termina en BCRYPT_TIMEOUT segundos.
+- `needs_rehash` detecta hashes con otro costo para re-hashearlos al login.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Optional
+
+from passlib.hash import bcrypt
+
+from .offload import native_executor
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 2)))
+BCRYPT_QUEUE = int(os.getenv("BCRYPT_QUEUE", "16"))      # en espera, además de los que corren
+BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", "10"))  # segundos
+
+_hasher = bcrypt.using(rounds=BCRYPT_ROUNDS)
+_executor = native_executor(BCRYPT_WORKERS, "bcrypt")  # hilos nativos también bajo gevent
+_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE)
+
+
+class HashPoolBusy(RuntimeError):
+    """El pool de bcrypt está lleno: el llamador debe responder 503."""
+
+
+def _run(fn: Callable, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashPoolBusy("pool de hashing saturado")
+    try:
+        fut = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    fut.add_done_callback(lambda _f: _slots.release())
+    try:
+        return fut.result(timeout=BCRYPT_TIMEOUT)
+    except FutureTimeout:
+        fut.cancel()  # si aún no empezó, libera su lugar en la cola
+        raise HashPoolBusy("hashing demorado") from None
+
+
+def hash_password(password: str) -> str:
+    return _run(_hasher.hash, password)
+
+
+def verify_password(password: str, pwd_hash: str) -> bool:
+    return bool(_run(bcrypt.verify, password, pwd_hash))
+
+
+def hash_rounds(pwd_hash: str) -> Optional[int]:
+    """Costo de un hash bcrypt ("$2b$12$..." -> 12) o None si no se reconoce."""
+    parts = (pwd_hash or "").split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pwd_hash: str) -> bool:
+    return hash_rounds(pwd_hash) != BCRYPT_ROUNDS
@@ -0,0 +1,173 @@
+# app/ratelimit.py
+"""
+Control de admisión para login, registro y envío de encuestas.
+
+- Token bucket por cuenta (email o id) y por IP, configurable por entorno:
+  RATELIMIT_<ENDPOINT>_ACCOUNT / RATELIMIT_<ENDPOINT>_IP = "N/S"
+  (N solicitudes cada S segundos, ráfaga N; "0" desactiva). El límite
+  fino es el de cuenta: un salón entero sale por la misma IP (NAT del
+  colegio), así que el de IP es solo un techo alto contra abusos.
+- Tope de concurrencia por endpoint (RATELIMIT_<ENDPOINT>_CONCURRENCY):
+  si está lleno se responde 503 de inmediato.
+- Buckets en memoria (dict acotado con desalojo LRU). Para varios workers
+  se puede compartir con Redis definiendo RATELIMIT_REDIS_URL (requiere el
+  paquete `redis`; el tope de concurrencia sigue siendo por proceso). Si
+  Redis falla en medio de la operación se sigue con buckets en memoria.
+- Cada decisión se cuenta en metrics como `ratelimit` (endpoint, outcome).
+
+Detrás de un proxy, define TRUSTED_PROXIES para que remote_addr sea la IP real.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import jsonify, request
+
+from . import metrics
+
+MAX_BUCKETS = int(os.getenv("RATELIMIT_MAX_BUCKETS", "100000"))
+
+
+def parse_rate(spec: Optional[str]) -> Optional[Tuple[float, float]]:
+    """'10/60' -> (tasa por segundo, ráfaga). '0' o vacío -> None (sin límite)."""
+    spec = (spec or "").strip()
+    if not spec or spec == "0":
+        return None
+    n, _, secs = spec.partition("/")
+    n, secs = float(n), float(secs or 1)
+    return n / secs, n
+
+
+class MemoryBackend:
+    """Token buckets en memoria: clave -> [tokens, último_ts]."""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Consume un token. Devuelve 0 si se admite, o segundos a esperar."""
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = [burst, now]
+                self._buckets[key] = b
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(burst, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            if b[0] >= 1:
+                b[0] -= 1
+                return 0.0
+            return (1 - b[0]) / rate
+
+
+class RedisBackend:
+    """Mismo algoritmo en Redis (script Lua atómico), compartido entre workers."""
+
+    _SCRIPT = """
+    local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local tokens = tonumber(b[1]) or burst
+    local ts = tonumber(b[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    RETRY_SECONDS = 30  # tras un error, cuánto usar memoria antes de volver a probar Redis
+
+    def __init__(self, url: str):
+        import redis  # opcional
+        self._errors = (redis.exceptions.RedisError, OSError)
+        self._r = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self._r.register_script(self._SCRIPT)
+        self._fallback = MemoryBackend()
+        self._down_until = 0.0
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        # Redis caído: límites por proceso en vez de 500 en cada login/envío
+        if time.monotonic() < self._down_until:
+            return self._fallback.take(key, rate, burst)
+        try:
+            return float(self._take(keys=[f"rl:{key}"], args=[rate, burst, time.time()]))
+        except self._errors as e:
+            print("[ratelimit] Redis falló, uso memoria:", e)
+            metrics.inc("ratelimit.redis_error")
+            self._down_until = time.monotonic() + self.RETRY_SECONDS
+            return self._fallback.take(key, rate, burst)
+
+
+def _make_backend():
+    url = os.getenv("RATELIMIT_REDIS_URL")
+    if url:
+        try:
+            return RedisBackend(url)
+        except Exception as e:
+            print("[ratelimit] Redis no disponible, uso memoria:", e)
+    return MemoryBackend()
+
+
+backend = _make_backend()
+
+
+def _env(endpoint: str, kind: str, default: str) -> str:
+    return os.getenv(f"RATELIMIT_{endpoint.upper()}_{kind}", default)
+
+
+def _reject(msg: str, code: int, retry_after: float):
+    resp = jsonify({"ok": False, "error": msg})
+    resp.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return resp, code
+
+
+def limit(endpoint: str, ip: str = "0", account: str = "0", concurrency: int = 0,
+          account_key: Optional[Callable[[], Optional[str]]] = None) -> Callable:
+    """
+    Decorador de admisión. `ip`/`account` son los valores por defecto ("N/S")
+    y `concurrency` el tope de requests simultáneos (0 = sin tope); todos se
+    pueden cambiar por entorno. `account_key()` devuelve la cuenta del request.
+    """
+    ip_rate = parse_rate(_env(endpoint, "IP", ip))
+    acct_rate = parse_rate(_env(endpoint, "ACCOUNT", account))
+    cap = int(_env(endpoint, "CONCURRENCY", str(concurrency)))
+    slots = threading.BoundedSemaphore(cap) if cap > 0 else None
+
+    def deco(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if ip_rate:
+                wait = backend.take(f"{endpoint}:ip:{request.remote_addr}", *ip_rate)
+                if wait:
+                    metrics.inc("ratelimit", endpoint=endpoint, outcome="limited_ip")
+                    return _reject("Demasiadas solicitudes, espera un momento.", 429, wait)
+            if acct_rate and account_key:
+                acct = account_key()
+                if acct:
+                    wait = backend.take(f"{endpoint}:acct:{acct}", *acct_rate)
+                    if wait:
+                        metrics.inc("ratelimit", endpoint=endpoint, outcome="limited_account")
+                        return _reject("Demasiados intentos para esta cuenta, espera un momento.", 429, wait)
+            if slots is not None and not slots.acquire(blocking=False):
+                metrics.inc("ratelimit", endpoint=endpoint, outcome="shed")
+                return _reject("Servidor ocupado, intenta de nuevo en unos segundos.", 503, 1)
+            metrics.inc("ratelimit", endpoint=endpoint, outcome="allowed")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if slots is not None:
+                    slots.release()
+        return wrapper
+    return deco
@@ -0,0 +1,248 @@
+# app/search.py
+"""
+Búsqueda de estudiantes por nombre o correo para el panel admin.
+
+Todo se compara normalizado: NFKD sin marcas diacríticas y en minúsculas,
+así "jose" encuentra "José" y "nuñez" a "Núñez" (los acentos que permite
+NAME_ALLOWED). El índice son dos listas ordenadas de términos (nombre y
+correo completos; cada palabra, el correo y su parte local) con sus ids en
+paralelo; los prefijos se resuelven con dos bisect y un slice. Si faltan resultados se busca como subcadena.
+
+Orden: coincidencia exacta > el nombre/correo empieza con la consulta >
+todas las palabras de la consulta son prefijo de alguna palabra > subcadena.
+Los niveles se calculan en ese orden y se corta al llenar el límite.
+
+Hay un índice por colegio (`for_tenant`). Se agrega cada alumno al
+registrarse y se reconstruye cada SEARCH_REBUILD_SECONDS (cubre lo
+registrado por otros workers): un solo hilo en segundo plano, mientras las
+búsquedas siguen usando el índice anterior.
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from .db import db_all
+from .statements import statement
+from .tenancy import current_tenant, use_tenant
+
+SEARCH_REBUILD_SECONDS = float(os.getenv("SEARCH_REBUILD_SECONDS", "300"))
+SUBSTRING_MIN = 3  # largo mínimo de la consulta para buscar como subcadena
+
+_SPLIT = re.compile(r"[\s@._+-]+")
+
+_STUDENTS = statement(
+    "search.students",
+    "SELECT id, fullname, email FROM users WHERE tenant_id=:t AND role='student'",
+)
+
+
+def normalize(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return " ".join(s.casefold().split())
+
+
+def _terms(name: str, email: str) -> List[str]:
+    out = set(t for t in _SPLIT.split(name) if t)
+    out.add(email)
+    out.add(email.split("@", 1)[0])
+    return sorted(out)
+
+
+def _range(keys: List[str], ids: List[int], prefix: str) -> List[int]:
+    """ids cuyos términos empiezan con `prefix` (dos bisect + slice)."""
+    lo = bisect.bisect_left(keys, prefix)
+    hi = bisect.bisect_left(keys, prefix + "\uffff")
+    return ids[lo:hi]
+
+
+class _Sorted:
+    """Términos ordenados con sus ids en listas paralelas."""
+
+    def __init__(self, pairs: List[Tuple[str, int]]):
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def insert(self, key: str, uid: int) -> None:
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, uid)
+
+    def remove(self, uid: int) -> None:
+        keep = [n for n, i in enumerate(self.ids) if i != uid]
+        self.keys = [self.keys[n] for n in keep]
+        self.ids = [self.ids[n] for n in keep]
+
+    def prefix(self, p: str) -> List[int]:
+        return _range(self.keys, self.ids, p)
+
+    def exact(self, key: str) -> List[int]:
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_right(self.keys, key)
+        return self.ids[lo:hi]
+
+
+class SearchIndex:
+    def __init__(self, tenant: int):
+        self.tenant = tenant
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._replay: Optional[List[Dict[str, Any]]] = None  # altas durante un rebuild
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._full = _Sorted([])   # nombre y correo completos
+        self._words = _Sorted([])  # palabras del nombre, correo y parte local
+        self._hay = ""             # "nombre\tcorreo\n" de todos, en orden de ranking
+        self._hay_pos: List[int] = []
+        self._hay_ids: List[int] = []
+        self._built_at: Optional[float] = None
+
+    # ---- mantenimiento ----
+    def rebuild(self, wait: bool = True) -> None:
+        if not self._build_lock.acquire(blocking=wait):
+            return  # ya hay otro hilo reconstruyendo
+        try:
+            if wait and not self._stale():
+                return  # lo reconstruyó otro hilo mientras esperábamos
+            with self._lock:
+                self._replay = []
+            try:
+                self._build()
+            finally:
+                with self._lock:
+                    replay, self._replay = self._replay, None
+                for user in replay:
+                    self.add(user)
+        finally:
+            self._build_lock.release()
+
+    def _build(self) -> None:
+        with use_tenant(self.tenant):
+            rows = db_all(_STUDENTS, {"t": self.tenant})
+        docs, full, words = {}, [], []
+        for r in rows:
+            doc = docs[r["id"]] = self._doc(r)
+            full += [(doc["_name"], r["id"]), (doc["_email"], r["id"])]
+            words += [(w, r["id"]) for w in doc["_words"]]
+        full, words = _Sorted(full), _Sorted(words)
+        hay, pos, ids, at = [], [], [], 0
+        for d in sorted(docs.values(), key=lambda d: d["_key"]):
+            line = f"{d['_name']}\t{d['_email']}\n"
+            hay.append(line)
+            pos.append(at)
+            ids.append(d["id"])
+            at += len(line)
+        with self._lock:
+            self._docs, self._full, self._words = docs, full, words
+            self._hay, self._hay_pos, self._hay_ids = "".join(hay), pos, ids
+            self._built_at = time.monotonic()
+
+    def add(self, user: Dict[str, Any]) -> None:
+        """Agrega (o reemplaza) un alumno recién registrado sin reconstruir."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(user)  # la lectura en curso puede no verlo
+            if self._built_at is None:
+                return  # se construirá completo en la primera búsqueda
+            uid = user["id"]
+            if uid in self._docs:
+                self._full.remove(uid)
+                self._words.remove(uid)
+            doc = self._docs[uid] = self._doc(user)
+            self._full.insert(doc["_name"], uid)
+            self._full.insert(doc["_email"], uid)
+            for w in doc["_words"]:
+                self._words.insert(w, uid)
+            # Al final del texto de subcadenas (el orden se corrige al reconstruir)
+            self._hay_pos.append(len(self._hay))
+            self._hay_ids.append(uid)
+            self._hay += f"{doc['_name']}\t{doc['_email']}\n"
+
+    @staticmethod
+    def _doc(r: Dict[str, Any]) -> Dict[str, Any]:
+        name, email = normalize(r["fullname"]), normalize(r["email"])
+        return {"id": r["id"], "fullname": r["fullname"], "email": r["email"],
+                "_name": name, "_email": email, "_words": _terms(name, email),
+                "_key": (len(name), name)}
+
+    def _stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at > SEARCH_REBUILD_SECONDS
+
+    def _ensure_fresh(self) -> None:
+        if self._built_at is None:
+            self.rebuild()
+        elif self._stale():
+            threading.Thread(target=self.rebuild, args=(False,),
+                             name="search-rebuild", daemon=True).start()
+
+    # ---- consulta ----
+    def search(self, q: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Hasta `limit` alumnos ordenados por nivel de coincidencia y, dentro
+        de cada nivel, nombres más cortos primero. Solo se ordenan los
+        candidatos de los niveles necesarios para llenar el límite.
+        """
+        self._ensure_fresh()
+        nq = normalize(q)
+        tokens = [t for t in _SPLIT.split(nq) if t]
+        if not tokens:
+            return []
+        with self._lock:
+            docs = self._docs
+            tiers = [set(self._full.exact(nq))]
+            tiers.append(set(self._full.prefix(nq)) - tiers[0])
+            seen = tiers[0] | tiers[1]
+            if len(seen) < limit:
+                ids = set(self._words.prefix(tokens[0]))
+                for t in tokens[1:]:
+                    ids &= set(self._words.prefix(t))
+                tiers.append(ids - seen)
+                seen |= ids
+            if len(seen) < limit and len(nq) >= SUBSTRING_MIN:
+                tiers.append(self._substring(nq, seen, limit - len(seen)))
+
+            out = []
+            for rank, ids in enumerate(tiers):
+                for i in heapq.nsmallest(limit - len(out), ids, key=lambda i: docs[i]["_key"]):
+                    d = docs[i]
+                    out.append({"id": i, "fullname": d["fullname"], "email": d["email"],
+                                "rank": rank})
+                if len(out) >= limit:
+                    break
+        return out
+
+    def _substring(self, nq: str, seen: set, need: int) -> set:
+        """Primeros `need` alumnos (en orden de ranking) que contienen `nq`, con str.find."""
+        found, at = set(), 0
+        while len(found) < need:
+            at = self._hay.find(nq, at)
+            if at < 0:
+                break
+            n = bisect.bisect_right(self._hay_pos, at) - 1
+            uid = self._hay_ids[n]
+            if uid not in seen:
+                found.add(uid)
+            # Salta al siguiente alumno
+            at = self._hay_pos[n + 1] if n + 1 < len(self._hay_pos) else len(self._hay)
+        return found
+
+
+_indexes: Dict[int, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def for_tenant(tid: Optional[int] = None) -> SearchIndex:
+    """Índice del colegio `tid` (por defecto el del request)."""
+    tid = current_tenant() if tid is None else tid
+    with _indexes_lock:
+        ix = _indexes.get(tid)
+        if ix is None:
+            ix = _indexes[tid] = SearchIndex(tid)
+        return ix
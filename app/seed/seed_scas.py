@@ -1,8 +1,8 @@
 # app/seed/seed_scas.py
 import os
-from passlib.hash import bcrypt
 from sqlalchemy import text
 from ..db import db_one, db_all, db_exec
+from ..passwords import hash_password
 
 TEXTOS = [
  "Me preocupan las cosas.",  # 1
@@ -148,7 +148,7 @@ def _ensure_admin():
     password = os.getenv("ADMIN_PASSWORD","admin123")
     db_exec("""INSERT INTO users(fullname,email,password_hash,role)
                VALUES (:fn,:em,:ph,'admin')""",
-            {"fn": fullname, "em": email, "ph": bcrypt.hash(password)})
+            {"fn": fullname, "em": email, "ph": hash_password(password)})
 
 def _ensure_scas():
     s = db_one("SELECT id FROM surveys WHERE code='SCAS_CHILD'")
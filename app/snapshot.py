@@ -0,0 +1,231 @@
+# app/snapshot.py
+"""
+Snapshot columnar en disco de los puntajes, para analítica y entrenamiento.
+
+SNAPSHOT_DIR contiene un archivo binario por columna (little-endian, sin
+cabecera) más meta.json con el número de filas y la marca de agua (último
+responses.id incluido):
+
+    response_id.bin int64   user_id.bin int32   ts.bin int64 (epoch UTC)
+    total.bin int16         gad.bin ... sad.bin int16
+
+`sync()` agrega solo lo nuevo desde la marca de agua (bloqueo con flock,
+así varios workers/cron no se pisan) y `open_snapshot()` mapea los archivos
+con np.memmap: sin copias, y las páginas se comparten entre procesos.
+
+Los archivos mapeados nunca se achican en su lugar (otro worker que los
+tenga mapeados recibiría SIGBUS): `rebuild` escribe columnas nuevas en .tmp
+y las cambia con os.replace; quien ya las mapeó sigue leyendo el inodo
+viejo. Los lectores comprueban el tamaño contra meta.json antes de mapear.
+
+Límite conocido: una transacción larga que confirme ids menores a la marca
+de agua después de un sync (p. ej. una importación en curso) no se verá
+hasta un `snapshot-sync --rebuild`; la importación masiva ya sincroniza al
+terminar.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+import click
+import numpy as np
+
+from .db import db_all
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", str(BASE_DIR / "snapshot")))
+SYNC_BATCH = 50_000
+
+COLUMNS: Dict[str, np.dtype] = {
+    "response_id": np.dtype("<i8"),
+    "user_id": np.dtype("<i4"),
+    "ts": np.dtype("<i8"),
+    "total": np.dtype("<i2"),
+    "gad": np.dtype("<i2"),
+    "soc": np.dtype("<i2"),
+    "ocd": np.dtype("<i2"),
+    "paa": np.dtype("<i2"),
+    "phb": np.dtype("<i2"),
+    "sad": np.dtype("<i2"),
+}
+
+_SELECT_NEW = """
+    SELECT r.id AS response_id, r.user_id, UNIX_TIMESTAMP(r.created_at) AS ts,
+           r.total_score AS total, r.gad, r.soc, r.ocd, r.paa, r.phb, r.sad
+    FROM responses r
+    JOIN surveys s ON s.id = r.survey_id AND s.code='SCAS_CHILD'
+    WHERE r.id > :hwm AND r.gad IS NOT NULL
+    ORDER BY r.id
+    LIMIT :lim
+"""
+
+
+def _meta_path(root: Path) -> Path:
+    return root / "meta.json"
+
+
+def read_meta(root: Path = SNAPSHOT_DIR) -> Dict[str, int]:
+    try:
+        with open(_meta_path(root), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {"count": 0, "hwm": 0}
+
+
+def _write_meta(root: Path, meta: Dict[str, int]) -> None:
+    tmp = root / "meta.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, _meta_path(root))
+
+
+@contextmanager
+def _locked(root: Path):
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _append_rows(files, meta):
+    """Escribe en `files` las filas con id > meta["hwm"]; devuelve el meta nuevo."""
+    count = meta["count"]
+    while True:
+        rows = db_all(_SELECT_NEW, {"hwm": meta["hwm"], "lim": SYNC_BATCH})
+        if not rows:
+            break
+        for col, dt in COLUMNS.items():
+            arr = np.fromiter((int(r[col] or 0) for r in rows), dtype=dt, count=len(rows))
+            files[col].write(arr.tobytes())
+        count += len(rows)
+        meta = {"count": count, "hwm": int(rows[-1]["response_id"])}
+        if len(rows) < SYNC_BATCH:
+            break
+    for fh in files.values():
+        fh.flush()
+        os.fsync(fh.fileno())
+    return meta
+
+
+def sync(root: Path = SNAPSHOT_DIR, rebuild: bool = False) -> Dict[str, int]:
+    """Agrega al snapshot las respuestas con id > marca de agua. Devuelve el meta nuevo."""
+    with _locked(root):
+        if rebuild:
+            return _rebuild(root)
+        meta = read_meta(root)
+        files = {}
+        try:
+            for col, dt in COLUMNS.items():
+                path = root / f"{col}.bin"
+                fh = open(path, "r+b" if path.exists() else "w+b")
+                # Descarta colas de un sync interrumpido (datos sin meta); lo
+                # mapeado por los lectores (hasta meta["count"]) no se toca
+                keep = meta["count"] * dt.itemsize
+                if os.fstat(fh.fileno()).st_size > keep:
+                    fh.truncate(keep)
+                fh.seek(0, os.SEEK_END)
+                files[col] = fh
+            meta = _append_rows(files, meta)
+        finally:
+            for fh in files.values():
+                fh.close()
+        _write_meta(root, meta)
+        return meta
+
+
+def _rebuild(root: Path) -> Dict[str, int]:
+    """Regenera todo en archivos .tmp y los publica con os.replace (bajo el flock)."""
+    files = {col: open(root / f"{col}.bin.tmp", "w+b") for col in COLUMNS}
+    try:
+        meta = _append_rows(files, {"count": 0, "hwm": 0})
+    finally:
+        for fh in files.values():
+            fh.close()
+    for col in COLUMNS:
+        os.replace(root / f"{col}.bin.tmp", root / f"{col}.bin")
+    _write_meta(root, meta)
+    return meta
+
+
+# -------- lectura (zero-copy) --------
+_open: Dict[str, object] = {"mtime": None, "cols": None, "meta": None}
+_open_lock = threading.Lock()
+
+
+def _map_columns(root: Path, n: int) -> Optional[Dict[str, np.ndarray]]:
+    """Mapea n filas por columna; None si algún archivo es más corto que meta."""
+    cols = {}
+    for col, dt in COLUMNS.items():
+        if not n:
+            cols[col] = np.empty((0,), dtype=dt)
+            continue
+        try:
+            fh = open(root / f"{col}.bin", "rb")
+        except FileNotFoundError:
+            return None
+        with fh:
+            # Tamaño del mismo archivo que se mapea (un rebuild puede cambiarlo)
+            if os.fstat(fh.fileno()).st_size < n * dt.itemsize:
+                return None
+            cols[col] = np.memmap(fh, dtype=dt, mode="r", shape=(n,))
+    return cols
+
+
+def open_snapshot_meta(root: Path = SNAPSHOT_DIR):
+    """
+    (columnas, meta) del snapshot: np.memmap de solo lectura y el meta con que
+    se mapearon ((None, None) si no existe). Se reabre solo cuando cambió
+    meta.json; si los archivos no cuadran con el meta (rebuild a medio
+    publicar) se siguen usando las columnas anteriores con su propio meta.
+    """
+    try:
+        mtime = _meta_path(root).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+    with _open_lock:
+        if _open["mtime"] != mtime:
+            meta = read_meta(root)
+            cols = _map_columns(root, meta["count"])
+            if cols is not None:
+                _open.update(cols=cols, meta=meta, mtime=mtime)
+        return _open["cols"], _open["meta"]
+
+
+def open_snapshot(root: Path = SNAPSHOT_DIR) -> Optional[Dict[str, np.ndarray]]:
+    """Columnas del snapshot como np.memmap de solo lectura (o None si no existe)."""
+    return open_snapshot_meta(root)[0]
+
+
+def start_background_sync(interval: float) -> None:
+    """Hilo daemon que sincroniza cada `interval` segundos (SNAPSHOT_SYNC_INTERVAL)."""
+    def loop():
+        while True:
+            try:
+                sync()
+            except Exception as e:
+                print("[snapshot] error de sync:", e)
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="snapshot-sync", daemon=True).start()
+
+
+# -------- CLI --------
+@click.command("snapshot-sync")
+@click.option("--rebuild", is_flag=True, help="Regenera el snapshot desde cero.")
+def snapshot_command(rebuild):
+    """Agrega las respuestas nuevas al snapshot columnar (SNAPSHOT_DIR)."""
+    t0 = time.perf_counter()
+    meta = sync(rebuild=rebuild)
+    click.echo(f"filas={meta['count']} marca={meta['hwm']} ({time.perf_counter() - t0:.2f}s)")
@@ -0,0 +1,87 @@
+# app/statements.py
+"""
+Registro de sentencias SQL con nombre, compiladas una sola vez por dialecto.
+
+Pasar SQL plano a db_one/db_all/db_exec obliga a SQLAlchemy a envolverlo en
+text(), volver a extraer los parámetros y buscar la compilación en caché en
+cada llamada. Una sentencia registrada guarda su cadena ya compilada para el
+dialecto del engine y se ejecuta con `exec_driver_sql`, directo al driver.
+Las que usan listas (bindparam expanding) se ejecutan con el text() ya armado,
+porque el IN se expande por llamada.
+
+Cada ejecución suma a la métrica `db.stmt` con el nombre de la sentencia:
+GET /api/admin/metrics muestra así un perfil barato por consulta.
+
+    _BY_EMAIL = statement("users.by_email", "SELECT id FROM users WHERE email=:e")
+    db_one(_BY_EMAIL, {"e": email})
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import bindparam, text
+
+from . import metrics
+
+_registry: Dict[str, "Statement"] = {}
+_lock = threading.Lock()
+
+
+class Statement:
+    def __init__(self, name: str, sql: str, expanding: Sequence[str] = ()):
+        self.name = name
+        self.sql = sql
+        self.clause = text(sql)
+        if expanding:
+            self.clause = self.clause.bindparams(*(bindparam(p, expanding=True) for p in expanding))
+        self.expanding = tuple(expanding)
+        self._compiled: Dict[str, tuple] = {}  # dialecto -> (sql del driver, orden posicional)
+
+    def __repr__(self) -> str:
+        return f"<Statement {self.name}>"
+
+    def _driver_sql(self, dialect):
+        c = self._compiled.get(dialect.name)
+        if c is None:
+            compiled = self.clause.compile(dialect=dialect)
+            c = (str(compiled), tuple(compiled.positiontup or ()) if compiled.positional else None)
+            self._compiled[dialect.name] = c
+        return c
+
+    def execute(self, conn, params=None):
+        """Ejecuta en `conn`; `params` puede ser un dict o una lista de dicts (executemany)."""
+        if self.expanding:
+            return conn.execute(self.clause, params or {})
+        sql, order = self._driver_sql(conn.dialect)
+        if order is not None:  # paramstyle posicional (qmark, format...)
+            if isinstance(params, list):
+                params = [tuple(p[k] for k in order) for p in params]
+            else:
+                params = tuple((params or {})[k] for k in order)
+        return conn.exec_driver_sql(sql, params if params is not None else {})
+
+
+def statement(name: str, sql: str, expanding: Sequence[str] = ()) -> Statement:
+    """Registra (una vez, al importar el módulo) y devuelve la sentencia `name`."""
+    with _lock:
+        if name in _registry:
+            raise ValueError(f"sentencia duplicada: {name}")
+        st = _registry[name] = Statement(name, sql, expanding)
+    return st
+
+
+def get(name: str) -> Statement:
+    return _registry[name]
+
+
+def profile() -> List[Dict[str, Any]]:
+    """Sentencias registradas con llamadas y tiempo acumulado, la más costosa primero."""
+    seen = {m["stmt"]: m for m in metrics.snapshot().get("db.stmt", []) if "stmt" in m}
+    out = []
+    for name in _registry:
+        m = seen.get(name, {})
+        out.append({"name": name, "calls": m.get("count", 0),
+                    "total_ms": m.get("total_ms", 0.0), "max_ms": m.get("max_ms", 0.0)})
+    out.sort(key=lambda r: r["total_ms"], reverse=True)
+    return out
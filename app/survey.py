@@ -1,45 +1,208 @@
 # app/survey.py
+import hashlib
+import re
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
+from sqlalchemy.exc import IntegrityError
 
+from . import analytics, history, neighbors
+from .admin import invalidate_panel
+from .cache import TTLCache
+from .compress import brotli, choose_encoding, compress
 from .db import db_all, db_one, db_exec
+from .events import publish_attempt
+from .ratelimit import limit
+from .users import current_user
 from .utils import require_auth, level_from_score
 from .ml import predict_level
+from .offload import run_cpu
+from .packing import WRITE_PACKED, WRITE_ROWS, pack_normalized
+from .statements import statement
+from .tenancy import current_tenant
 
 # Este blueprint ya trae su prefijo /api/survey
 bp = Blueprint("survey", __name__, url_prefix="/api/survey")
 
+SUBSCALES = ("GAD", "SOC", "OCD", "PAA", "PHB", "SAD")
+
+# Metadatos de SCAS por colegio: los ítems se siembran al arrancar y casi
+# nunca cambian (un colegio con base propia tiene sus propios ids)
+_META = TTLCache(maxsize=256, ttl=300)
+# Definición servida (JSON ya serializado + ETag + variantes comprimidas)
+_DEF = TTLCache(maxsize=256, ttl=300)
+
+# Id que genera el cliente por intento (reintentos offline del mismo envío)
+CLIENT_REF = re.compile(r"^[A-Za-z0-9_-]{8,40}$")
+
+# Sentencias del flujo de la encuesta (ver app/statements.py)
+_SURVEY = statement("survey.def", "SELECT * FROM surveys WHERE code='SCAS_CHILD'")
+_ITEM_META = statement(
+    "survey.item_meta",
+    "SELECT id, item_number, is_scored, subscale FROM survey_items WHERE survey_id=:sid",
+)
+_ITEMS = statement("survey.items", """
+    SELECT id, item_number, prompt, is_scored, subscale
+    FROM survey_items
+    WHERE survey_id=:sid
+    ORDER BY item_number
+""")
+_LAST_ATTEMPT = statement("survey.last_attempt", """
+    SELECT id, created_at
+    FROM responses
+    WHERE user_id=:u AND survey_id=:s
+    ORDER BY created_at DESC
+    LIMIT 1
+""")
+_BY_CLIENT_REF = statement(
+    "survey.by_client_ref",
+    "SELECT id FROM responses WHERE user_id=:u AND client_ref=:c",
+)
+_INSERT_RESPONSE = statement("survey.insert_response", """
+    INSERT INTO responses(user_id, tenant_id, survey_id, total_score,
+                          gad, soc, ocd, paa, phb, sad, answers_packed, answers_mask, client_ref)
+    VALUES (:u, :tid, :s, :t, :GAD, :SOC, :OCD, :PAA, :PHB, :SAD, :ap, :am, :cr)
+""")
+_INSERT_ITEMS = statement(
+    "survey.insert_items",
+    "INSERT INTO response_items(response_id, item_id, value) VALUES (:r,:i,:v)",
+)
+
+
+def _load_meta():
+    s = db_one(_SURVEY)
+    if not s:
+        return None
+    rows = db_all(_ITEM_META, {"sid": s["id"]})
+    return {
+        "sid": s["id"],
+        "items": {r["id"]: {"is_scored": r["is_scored"], "subscale": r["subscale"],
+                            "item_number": r["item_number"]} for r in rows},
+        "by_number": {r["item_number"]: r["id"] for r in rows},
+    }
+
+
+def scas_meta():
+    """
+    Metadatos cacheados de SCAS_CHILD (o None si no está sembrada):
+    { sid, items: {item_id: {is_scored, subscale, item_number}}, by_number: {n: item_id} }
+    """
+    return _META.get_or_set(("SCAS_CHILD", current_tenant()), _load_meta)
+
+
+def _load_def():
+    s = db_one(_SURVEY)
+    if not s:
+        return None
+    items = db_all(_ITEMS, {"sid": s["id"]})
+    body = current_app.json.dumps({"survey": s, "items": items}).encode("utf-8")
+    variants = {"gzip": compress(body, "gzip")}
+    if brotli is not None:
+        variants["br"] = compress(body, "br")
+    return {"body": body, "etag": hashlib.sha256(body).hexdigest()[:20], "variants": variants}
+
+
+def scas_definition():
+    """
+    Definición de SCAS_CHILD tal como la sirve GET /scas (o None):
+    { body: bytes JSON, etag, variants: {"gzip"|"br": bytes} }.
+    El ETag es la versión: cambia solo si cambian la encuesta o sus ítems
+    (las variantes comprimidas se sirven con ETag "<versión>-<codificación>").
+    """
+    return _DEF.get_or_set(("SCAS_CHILD", current_tenant()), _load_def)
+
+
+def _after_submit(user, total, subs, first_attempt):
+    """Efectos posteriores a guardar un intento nuevo (deltas al panel admin, analítica)."""
+    invalidate_panel()
+    analytics.invalidate()
+    neighbors.for_tenant().update(user["id"], subs)
+    publish_attempt(user, total, level_from_score(total), datetime.utcnow(), first_attempt)
+
+
+def score_answers(normalized, items):
+    """Suma total y subescalas de [(item_id, valor 0..3), ...] según `items`."""
+    subs = {k: 0 for k in SUBSCALES}
+    total = 0
+    for iid, val in normalized:
+        m = items.get(iid)
+        if m and m["is_scored"]:
+            total += val
+            if m["subscale"]:
+                subs[m["subscale"]] += val
+    return total, subs
+
+
+# ------------------ Historial del alumno ------------------
+@bp.get("/scas/history")
+@require_auth()
+def scas_history():
+    """Intentos propios con tendencia. ?before=<id>&limit=N"""
+    user = current_user(request.user)
+    if not user:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+    try:
+        before, limit = history.page_args(request.args)
+    except ValueError:
+        return jsonify({"error": "before y limit deben ser enteros"}), 400
+    return jsonify(history.page(user["id"], before, limit))
+
 
 # ------------------ Cargar encuesta SCAS ------------------
 @bp.get("/scas")
 @require_auth()
 def scas_def():
-    """Devuelve metadatos de la encuesta SCAS + lista de ítems."""
-    s = db_one("SELECT * FROM surveys WHERE code='SCAS_CHILD'")
-    if not s:
+    """
+    Devuelve metadatos de la encuesta SCAS + lista de ítems.
+    Con If-None-Match igual a la versión actual responde 304 sin cuerpo.
+    """
+    d = scas_definition()
+    if not d:
         return jsonify({"error": "Encuesta no encontrada"}), 404
 
-    items = db_all(
-        """
-        SELECT id, item_number, prompt, is_scored, subscale
-        FROM survey_items
-        WHERE survey_id=:sid
-        ORDER BY item_number
-        """,
-        {"sid": s["id"]}
-    )
-    return jsonify({"survey": s, "items": items})
+    # Un ETag fuerte por codificación: cada variante es otra secuencia de bytes
+    enc = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    enc = enc if enc in d["variants"] else None
+    etag = f'{d["etag"]}-{enc}' if enc else d["etag"]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache",
+               "Vary": "Accept-Encoding, Authorization"}
+    if etag in request.if_none_match:
+        resp = Response(status=304, headers=headers)
+        resp.direct_passthrough = True
+        return resp
+
+    body = d["body"]
+    if enc:
+        body = d["variants"][enc]
+        headers["Content-Encoding"] = enc
+    resp = Response(body, headers=headers, mimetype="application/json")
+    resp.direct_passthrough = True  # ya viene comprimido
+    return resp
+
+
+@bp.get("/scas/version")
+@require_auth()
+def scas_version():
+    """Versión (ETag) de la definición: el cliente offline solo recarga si cambió."""
+    d = scas_definition()
+    if not d:
+        return jsonify({"error": "Encuesta no encontrada"}), 404
+    resp = jsonify({"version": d["etag"]})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 # ------------------ Enviar respuestas SCAS ------------------
 @bp.post("/scas/submit")
 @require_auth()
+@limit("submit", ip="300/60", account="6/60", concurrency=32,
+       account_key=lambda: request.user.get("id") or request.user.get("email"))
 def scas_submit():
     """
-    Recibe: { answers: [{item_id, value}, ...] }
+    Recibe: { answers: [{item_id, value}, ...], client_ref?: "id del intento" }
     - Normaliza valores 0..3
     - Calcula total y subescalas
     - Previene doble click (si hay una respuesta del mismo usuario hace <5s)
+    - Idempotente por client_ref: un reintento del mismo intento no duplica
     - Guarda cabecera en responses y detalle en response_items
     - Devuelve etiqueta por regla + predicción ML
     """
@@ -47,22 +210,16 @@ def scas_submit():
     answers = data.get("answers") or []
     if not answers:
         return jsonify({"error": "Sin respuestas"}), 400
+    client_ref = str(data.get("client_ref") or "").strip() or None
+    if client_ref and not CLIENT_REF.match(client_ref):
+        return jsonify({"error": "client_ref inválido"}), 400
 
-    s = db_one("SELECT id FROM surveys WHERE code='SCAS_CHILD'")
-    if not s:
+    meta = scas_meta()
+    if not meta:
         return jsonify({"error": "Encuesta no encontrada"}), 404
-    sid = s["id"]
-
-    # --- Metadatos de ítems ---
-    meta = db_all(
-        "SELECT id, is_scored, subscale FROM survey_items WHERE survey_id=:sid",
-        {"sid": sid}
-    )
-    info = {m["id"]: {"is_scored": m["is_scored"], "subscale": m["subscale"]} for m in meta}
+    sid = meta["sid"]
 
     # --- Normalización + puntajes ---
-    subs = {"GAD": 0, "SOC": 0, "OCD": 0, "PAA": 0, "PHB": 0, "SAD": 0}
-    total = 0
     normalized = []
     for a in answers:
         try:
@@ -73,36 +230,27 @@ def scas_submit():
         val = max(0, min(3, val))  # clamp 0..3
         normalized.append((iid, val))
 
-        m = info.get(iid)
-        if m and m["is_scored"]:
-            total += val
-            if m["subscale"]:
-                subs[m["subscale"]] += val
-
     if not normalized:
         return jsonify({"error": "Respuestas inválidas"}), 400
+    total, subs = score_answers(normalized, meta["items"])
 
     # --- Usuario actual ---
-    user = db_one("SELECT id, fullname, email FROM users WHERE email=:e", {"e": request.user["email"]})
+    user = current_user(request.user)
     if not user:
         return jsonify({"error": "Usuario no encontrado"}), 400
     uid = user["id"]
 
     # --- Anti doble click: reusar respuesta si la última es muy reciente ---
-    last = db_one(
-        """
-        SELECT id, created_at
-        FROM responses
-        WHERE user_id=:u AND survey_id=:s
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        {"u": uid, "s": sid}
-    )
+    last = db_one(_LAST_ATTEMPT, {"u": uid, "s": sid}, primary=True)
 
     reuse_last = False
     resp_id = None
-    if last and isinstance(last.get("created_at"), datetime):
+    # Reintento de un envío que ya llegó (la respuesta se perdió en la red)
+    prev = db_one(_BY_CLIENT_REF, {"u": uid, "c": client_ref}, primary=True) if client_ref else None
+    if prev:
+        reuse_last = True
+        resp_id = prev["id"]
+    elif last and isinstance(last.get("created_at"), datetime):
         # created_at viene como naive UTC (por nuestra conexión)
         delta = datetime.utcnow() - last["created_at"].replace(tzinfo=None)
         if delta.total_seconds() < 5:
@@ -112,29 +260,31 @@ def scas_submit():
     # --- Insertar nueva respuesta (si no reusamos la última) ---
     if not reuse_last:
         # Cabecera
-        db_exec(
-            "INSERT INTO responses(user_id, survey_id, total_score) VALUES (:u,:s,:t)",
-            {"u": uid, "s": sid, "t": total}
-        )
-        # Recupera ID de esa respuesta (por fecha más reciente del mismo usuario/encuesta)
-        newrow = db_one(
-            """
-            SELECT id FROM responses
-            WHERE user_id=:u AND survey_id=:s
-            ORDER BY created_at DESC
-            LIMIT 1
-            """,
-            {"u": uid, "s": sid}
-        )
+        packed, mask = pack_normalized(normalized, meta["items"]) if WRITE_PACKED else (None, None)
+        try:
+            db_exec(
+                _INSERT_RESPONSE,
+                {"u": uid, "tid": user.get("tenant_id") or current_tenant(), "s": sid, "t": total,
+                 **subs, "ap": packed, "am": mask, "cr": client_ref}
+            )
+            # Recupera ID de esa respuesta (por fecha más reciente del mismo usuario/encuesta)
+            newrow = db_one(_LAST_ATTEMPT, {"u": uid, "s": sid}, primary=True)
+        except IntegrityError:
+            # Dos reintentos del mismo client_ref a la vez: gana el primero
+            newrow = db_one(_BY_CLIENT_REF, {"u": uid, "c": client_ref}, primary=True) if client_ref else None
+            if not newrow:
+                raise
+            reuse_last = True
         resp_id = newrow["id"] if newrow else None
 
-        # Detalle de ítems
-        if resp_id:
-            for iid, val in normalized:
+        # Detalle de ítems (solo en formato "rows"/"both"; en una sola sentencia)
+        if resp_id and not reuse_last:
+            if WRITE_ROWS:
                 db_exec(
-                    "INSERT INTO response_items(response_id, item_id, value) VALUES (:r,:i,:v)",
-                    {"r": resp_id, "i": iid, "v": val}
+                    _INSERT_ITEMS,
+                    [{"r": resp_id, "i": iid, "v": val} for iid, val in normalized]
                 )
+            _after_submit(user, total, subs, first_attempt=last is None)
 
     # --- Etiqueta por regla + ML ---
     features = {
@@ -146,7 +296,7 @@ def scas_submit():
         "PHB": float(subs.get("PHB", 0)),
         "SAD": float(subs.get("SAD", 0)),
     }
-    ml_out = predict_level(features)
+    ml_out = run_cpu(predict_level, features)
 
     return jsonify({
         "response_id": resp_id,
@@ -0,0 +1,46 @@
+# app/tenancy.py
+"""
+Colegio (tenant) del request en curso.
+
+Cada usuario y cada respuesta pertenecen a un colegio (tenants.id). El token
+lleva `tid`; require_auth lo deja en flask.g y todo lo que depende del
+colegio (consultas admin, cachés, engine de BD) lo lee con current_tenant().
+Fuera de un request (CLI, arranque, hilos de fondo) vale DEFAULT_TENANT
+salvo dentro de `use_tenant(tid)`.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from flask import g, has_app_context
+
+DEFAULT_TENANT = 1
+
+_override: ContextVar[Optional[int]] = ContextVar("tenant_override", default=None)
+
+
+def current_tenant() -> int:
+    tid = _override.get()
+    if tid is not None:
+        return tid
+    if has_app_context():
+        tid = g.get("tenant_id")
+        if tid is not None:
+            return tid
+    return DEFAULT_TENANT
+
+
+def set_request_tenant(tid) -> None:
+    g.tenant_id = int(tid or DEFAULT_TENANT)
+
+
+@contextmanager
+def use_tenant(tid: int):
+    """Fija el colegio para código fuera de un request (CLI, hilos de fondo)."""
+    token = _override.set(int(tid))
+    try:
+        yield
+    finally:
+        _override.reset(token)
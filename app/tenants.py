@@ -0,0 +1,154 @@
+# app/tenants.py
+"""
+Alta y búsqueda de colegios (tabla tenants, siempre en la base principal).
+
+Un colegio con `db_url` vive en su propia base: al crearlo se crea la base
+(CREATE DATABASE) con sus tablas y la encuesta, y al arrancar la app se le
+aplican las mismas evoluciones que a la principal (`migrate_tenant_databases`).
+Desde entonces todo request con su `tid` usa ese engine (ver db.engine). Sin
+`db_url` comparte la base principal y se separa por la columna tenant_id.
+
+Registrarse en un colegio exige su código de acceso (`join_code`), que se
+entrega al crear el colegio; se guarda solo su sha256. Sin código el registro
+en ese colegio queda cerrado.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import secrets
+from typing import Any, Dict, Optional
+
+import click
+from sqlalchemy import text
+
+from .cache import TTLCache
+from .db import (backfill_response_scores, create_database_if_needed, create_tables_if_needed,
+                 forget_tenant, main_engine)
+from .passwords import hash_password
+from .tenancy import use_tenant
+
+_by_code = TTLCache(maxsize=1024, ttl=300)
+
+
+def tenant_by_code(code: str) -> Optional[Dict[str, Any]]:
+    code = (code or "").strip().lower()
+    if not code:
+        return None
+
+    def load():
+        with main_engine().connect() as conn:
+            row = conn.execute(
+                text("SELECT id, code, name, join_hash FROM tenants WHERE code=:c"), {"c": code}
+            ).mappings().first()
+        return dict(row) if row else None
+
+    return _by_code.get_or_set(code, load)
+
+
+def new_join_code() -> str:
+    return secrets.token_hex(5)
+
+
+def _join_hash(join_code: str) -> str:
+    return hashlib.sha256(join_code.strip().encode()).hexdigest()
+
+
+def check_join_code(tenant: Dict[str, Any], join_code: Optional[str]) -> bool:
+    """True si `join_code` es el código de acceso del colegio."""
+    expected = tenant.get("join_hash")
+    if not expected or not join_code:
+        return False
+    return hmac.compare_digest(expected, _join_hash(join_code))
+
+
+def set_join_code(code: str, join_code: str) -> bool:
+    """Cambia el código de acceso del colegio. False si no existe."""
+    code = code.strip().lower()
+    with main_engine().begin() as conn:
+        res = conn.execute(
+            text("UPDATE tenants SET join_hash=:h WHERE code=:c"),
+            {"h": _join_hash(join_code), "c": code},
+        )
+    _by_code.pop(code)  # los demás workers lo ven al vencer su caché
+    return bool(res.rowcount)
+
+
+def _provision(tid: int, db_url: str) -> None:
+    """Crea (si falta) y migra la base propia del colegio."""
+    from .seed.seed_scas import run_seed
+    create_database_if_needed(db_url)
+    with use_tenant(tid):
+        create_tables_if_needed()
+        run_seed()
+        backfill_response_scores()
+
+
+def migrate_tenant_databases() -> None:
+    """Aplica create_tables/seed a cada base propia (al arrancar, como la principal)."""
+    with main_engine().connect() as conn:
+        rows = conn.execute(text("SELECT id, db_url FROM tenants WHERE db_url IS NOT NULL")).all()
+    for tid, db_url in rows:
+        _provision(tid, db_url)
+
+
+def create_tenant(code: str, name: str, db_url: Optional[str] = None,
+                  admin_email: Optional[str] = None,
+                  admin_password: Optional[str] = None,
+                  join_code: Optional[str] = None) -> int:
+    """Registra el colegio (y su base, admin y código de acceso, si se indican). Devuelve su id."""
+    with main_engine().begin() as conn:
+        res = conn.execute(
+            text("INSERT INTO tenants (code, name, db_url, join_hash) VALUES (:c, :n, :u, :h)"),
+            {"c": code.strip().lower(), "n": name, "u": db_url or None,
+             "h": _join_hash(join_code) if join_code else None},
+        )
+        tid = res.lastrowid
+    forget_tenant(tid)
+
+    if db_url:
+        _provision(tid, db_url)
+    with use_tenant(tid):
+        if admin_email:
+            from .db import engine
+            with engine().begin() as conn:
+                conn.execute(
+                    text(
+                        """
+                        INSERT INTO users (fullname, email, role, tenant_id, password_hash)
+                        VALUES (:n, :e, 'admin', :t, :ph)
+                        """
+                    ),
+                    {"n": f"Administrador {name}", "e": admin_email.lower(), "t": tid,
+                     "ph": hash_password(admin_password)},
+                )
+    return tid
+
+
+# -------- CLI --------
+@click.command("create-tenant")
+@click.argument("code")
+@click.argument("name")
+@click.option("--db-url", default=None, help="Base propia del colegio (mysql+pymysql://...).")
+@click.option("--admin-email", default=None)
+@click.option("--admin-password", default=None)
+@click.option("--join-code", default=None, help="Código de acceso para registrarse (por defecto uno al azar).")
+def create_tenant_command(code, name, db_url, admin_email, admin_password, join_code):
+    """Da de alta un colegio: flask create-tenant CODIGO "Nombre" [--db-url URL]."""
+    if admin_email and not admin_password:
+        raise click.UsageError("--admin-password es obligatorio con --admin-email")
+    join_code = join_code or new_join_code()
+    tid = create_tenant(code, name, db_url, admin_email, admin_password, join_code)
+    click.echo(f"colegio {code} creado con id={tid}" + (" (base propia)" if db_url else ""))
+    click.echo(f"código de acceso para registrarse: {join_code}")
+
+
+@click.command("tenant-join-code")
+@click.argument("code")
+@click.option("--join-code", default=None, help="Nuevo código (por defecto uno al azar).")
+def tenant_join_code_command(code, join_code):
+    """Cambia (o abre) el registro de un colegio: flask tenant-join-code CODIGO."""
+    join_code = join_code or new_join_code()
+    if not set_join_code(code, join_code):
+        raise click.UsageError(f"no existe el colegio {code}")
+    click.echo(f"código de acceso de {code}: {join_code}")
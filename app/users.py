@@ -0,0 +1,49 @@
+# app/users.py
+"""
+Filas de usuario cacheadas por id (sin password_hash).
+
+El token ya trae el id, así que los endpoints autenticados no necesitan
+volver a buscar al usuario por email en cada request. Cualquier cambio a un
+usuario debe llamar a `invalidate_user(uid)`. La clave incluye el colegio:
+con bases propias por colegio los ids se repiten.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+from .cache import TTLCache
+from .db import db_one
+from .statements import statement
+from .tenancy import current_tenant
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+_users = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")), ttl=USER_CACHE_TTL)
+
+_BY_ID = statement("users.by_id",
+                   "SELECT id, fullname, email, role, tenant_id, gender, age FROM users WHERE id=:id")
+_BY_EMAIL = statement("users.by_email",
+                      "SELECT id, fullname, email, role, tenant_id, gender, age FROM users WHERE email=:e")
+
+
+def get_user(uid: int) -> Optional[Dict[str, Any]]:
+    return _users.get_or_set((current_tenant(), uid), lambda: db_one(
+        _BY_ID, {"id": uid},
+        primary=True,  # recién registrado: la réplica podría no tenerlo aún
+    ))
+
+
+def current_user(claims: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Usuario del token: por id (cacheado) o, para tokens viejos sin id, por email."""
+    uid = claims.get("id")
+    if uid is not None:
+        return get_user(int(uid))
+    return db_one(
+        _BY_EMAIL,
+        {"e": claims.get("email")},
+        primary=True,
+    )
+
+
+def invalidate_user(uid: int) -> None:
+    _users.pop((current_tenant(), uid))
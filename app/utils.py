@@ -1,6 +1,8 @@
 # app/utils.py
+import hashlib
 import os
 import re
+import time
 import jwt
 from datetime import datetime, timedelta, timezone
 from functools import wraps
@@ -9,9 +11,17 @@ from flask import request, jsonify
 from dotenv import load_dotenv
 from jwt import ExpiredSignatureError, InvalidTokenError
 
+from .cache import TTLCache
+from .tenancy import set_request_tenant
+
 load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET", "clave_secreta_super_segura")
 
+# Tokens ya verificados (clave = sha256 del token); cada entrada vence con su `exp`
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+_verified = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
 # Validaciones
 # Nombre: solo letras (mayúsc/minúsc) + espacios (incluye acentos)
 NAME_ALLOWED  = re.compile(r"^[A-Za-zÁÉÍÓÚÜÑáéíóúüñ ]+$")
@@ -22,33 +32,70 @@ EMAIL_ALLOWED = re.compile(
     re.IGNORECASE
 )
 
-def make_token(payload: Dict[str, Any], hours: int = 2) -> str:
+# Token de stream: va en la URL de EventSource (queda en logs de acceso), así
+# que solo sirve para abrir /stream y vence en segundos
+STREAM_TOKEN_SECONDS = int(os.getenv("STREAM_TOKEN_SECONDS", "60"))
+STREAM_SCOPE = "stream"
+
+def make_token(payload: Dict[str, Any], hours: float = 2) -> str:
     now = datetime.now(timezone.utc)
     data = {**payload, "iat": now, "exp": now + timedelta(hours=hours)}
     return jwt.encode(data, JWT_SECRET, algorithm="HS256")
 
+def make_stream_token(user: Dict[str, Any]) -> str:
+    """Token corto para `?token=` de un stream SSE, derivado del usuario autenticado."""
+    claims = {k: user.get(k) for k in ("id", "email", "role", "fullname", "tid")}
+    return make_token({**claims, "scope": STREAM_SCOPE}, hours=STREAM_TOKEN_SECONDS / 3600)
+
 def verify_token(token: str) -> Dict[str, Any]:
     return jwt.decode(token, JWT_SECRET, algorithms=["HS256"], options={"require": ["exp", "iat"]})
 
-def require_auth(role: Optional[str] = None) -> Callable:
+def verify_token_cached(token: str) -> Dict[str, Any]:
+    """
+    Igual que verify_token pero evita repetir la firma HS256 para tokens ya
+    vistos. Nunca sirve un token vencido: la entrada caduca en su `exp`.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = _verified.get(key)
+    if claims is not None and claims["exp"] > time.time():
+        return dict(claims)
+    claims = verify_token(token)
+    ttl = min(TOKEN_CACHE_TTL, claims["exp"] - time.time())
+    if ttl > 0:
+        _verified.set(key, claims, ttl=ttl)
+    return dict(claims)
+
+def require_auth(role: Optional[str] = None, query_token: bool = False) -> Callable:
+    """
+    Exige JWT en `Authorization: Bearer`. Con `query_token=True` también acepta
+    `?token=` (EventSource no permite cabeceras propias), pero solo un token
+    de stream (make_stream_token); a su vez un token de stream no vale como
+    Bearer. Deja el colegio del token (`tid`) como colegio del request.
+    """
     def deco(fn: Callable) -> Callable:
         @wraps(fn)
         def wrapper(*args, **kwargs):
             auth = request.headers.get("Authorization", "")
-            if not auth.startswith("Bearer "):
+            if auth.startswith("Bearer "):
+                token, scope = auth[7:], None
+            elif query_token and request.args.get("token"):
+                token, scope = request.args["token"], STREAM_SCOPE
+            else:
                 return jsonify({"error": "No token"}), 401
-            token = auth[7:]
             try:
-                user = verify_token(token)
+                user = verify_token_cached(token)
             except ExpiredSignatureError:
                 return jsonify({"error": "Token expirado"}), 401
             except InvalidTokenError:
                 return jsonify({"error": "Token inválido"}), 401
+            if user.get("scope") != scope:
+                return jsonify({"error": "Token inválido"}), 401
 
             if role and user.get("role") != role:
                 return jsonify({"error": "No autorizado"}), 403
 
             request.user = user  # type: ignore[attr-defined]
+            set_request_tenant(user.get("tid"))  # tokens viejos sin tid: colegio por defecto
             return fn(*args, **kwargs)
         return wrapper
     return deco
@@ -0,0 +1,81 @@
+# bench/bench_concurrency.py
+"""
+Mide envíos SCAS concurrentes contra un servidor en marcha, para comparar
+el modo sync con el modo async (gevent):
+
+    gunicorn -w 1 wsgi:app                          # sync
+    WORKER_CLASS=gevent gunicorn -w 1 wsgi:app      # async
+
+    python bench/bench_concurrency.py http://127.0.0.1:8000 --users 200 --rounds 2
+
+Registra (o reutiliza) alumnos bench_<n>@gmail.com y dispara un envío por
+alumno y ronda, todos en paralelo. Conviene subir RATELIMIT_SUBMIT_IP y
+RATELIMIT_SUBMIT_CONCURRENCY en el servidor mientras se mide.
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def call(base, path, body=None, token=None):
+    req = urllib.request.Request(base + path, method="POST" if body is not None else "GET")
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    data = json.dumps(body).encode() if body is not None else None
+    try:
+        with urllib.request.urlopen(req, data, timeout=60) as r:
+            return r.status, json.loads(r.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def token_for(base, n):
+    email, pwd = f"bench_{n}@gmail.com", "bench123"
+    st, out = call(base, "/auth/login", {"email": email, "password": pwd})
+    if st != 200:
+        st, out = call(base, "/auth/register", {
+            "fullname": "Bench Alumno", "email": email, "password": pwd, "age": 13,
+        })
+    return out.get("token")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("base")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--rounds", type=int, default=1)
+    args = ap.parse_args()
+    base = args.base.rstrip("/")
+
+    with ThreadPoolExecutor(16) as ex:
+        tokens = [t for t in ex.map(lambda n: token_for(base, n), range(args.users)) if t]
+    _, survey = call(base, "/api/survey/scas", token=tokens[0])
+    answers = [{"item_id": it["id"], "value": it["item_number"] % 4} for it in survey["items"]]
+
+    def submit(tok):
+        t0 = time.perf_counter()
+        st, _ = call(base, "/api/survey/scas/submit", {"answers": answers}, tok)
+        return st, time.perf_counter() - t0
+
+    jobs = tokens * args.rounds
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(len(tokens)) as ex:
+        results = list(ex.map(submit, jobs))
+    wall = time.perf_counter() - t0
+
+    lat = sorted(dt for st, dt in results if st == 200)
+    errors = len(results) - len(lat)
+    print(f"envíos={len(results)} ok={len(lat)} errores={errors} en {wall:.2f}s "
+          f"-> {len(lat) / wall:.1f} req/s")
+    if lat:
+        p95 = lat[int(len(lat) * 0.95) - 1] if len(lat) > 1 else lat[0]
+        print(f"latencia p50={statistics.median(lat) * 1000:.0f} ms  p95={p95 * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
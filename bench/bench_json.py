@@ -0,0 +1,64 @@
+# bench/bench_json.py
+"""
+Compara el JSON por defecto de Flask contra FastJSONProvider y mide el
+tamaño con gzip/br para un payload tipo /api/admin/students.
+
+Uso:  python bench/bench_json.py [n_filas]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.compress import brotli, compress
+from app.fastjson import FastJSONProvider, orjson
+
+
+def payload(n):
+    base = datetime(2025, 3, 1, 8, 0, 0)
+    students = [{
+        "id": i,
+        "fullname": f"Estudiante Número {i}",
+        "email": f"alumno{i}@gmail.com",
+        "attempts": i % 5,
+        "last_score": (i * 7) % 114,
+        "last_level": "Moderado",
+        "last_date": base + timedelta(minutes=i),
+    } for i in range(n)]
+    return {"students": students,
+            "stats": {"students": n, "attempts": 3 * n, "avg_last": Decimal("41")}}
+
+
+def bench(label, fn, reps):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        out = fn()
+    dt = (time.perf_counter() - t0) / reps * 1000
+    print(f"{label:<28} {dt:8.2f} ms   {len(out):>9} B")
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    data = payload(n)
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    print(f"filas={n}  orjson={'sí' if orjson else 'no'}  brotli={'sí' if brotli else 'no'}")
+    with app.app_context():
+        bench("flask default dumps", lambda: default.dumps(data).encode(), 20)
+        body = bench("FastJSONProvider dumps", lambda: fast.dumps(data).encode(), 20)
+    bench("gzip (nivel 6)", lambda: compress(body, "gzip"), 10)
+    if brotli:
+        bench("brotli (calidad 5)", lambda: compress(body, "br"), 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# gunicorn.conf.py
+# gunicorn lo carga solo (Procfile: `gunicorn wsgi:app`).
+#
+# Modo sync (por defecto): un request por worker; la concurrencia = workers.
+# Modo async: WORKER_CLASS=gevent. Cada worker atiende cientos de requests
+# en vuelo como greenlets; PyMySQL queda cooperativo (gevent parchea los
+# sockets) y bcrypt/ML corren en hilos nativos (app/offload.py). Ajusta
+# DB_POOL_SIZE/DB_MAX_OVERFLOW al número de conexiones que aguante MySQL.
+#
+# El stream en vivo del panel admin (/api/admin/stream) solo se sirve bajo
+# gevent: en modo sync tendría tomado un worker por panel abierto, así que
+# responde 503 y el panel recarga la lista cada STREAM_POLL_SECONDS.
+import os
+
+worker_class = os.getenv("WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
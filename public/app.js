@@ -2,6 +2,7 @@
    Cliente de auth (registro/login/sesión) con soporte local y GitHub Pages.
    - Endpoints: /auth/register, /auth/login, /auth/me
    - JWT en Authorization Bearer
+   - Service worker (sw.js) para que la encuesta del alumno funcione sin red
 */
 
 const $ = (sel) => document.querySelector(sel);
@@ -61,7 +62,9 @@ async function api(path, { method="GET", body, auth=true, headers={} } = {}){
   try{
     res  = await fetch(url, opts);
   }catch(e){
-    throw new Error("No se pudo conectar con el servidor.");
+    const err = new Error("No se pudo conectar con el servidor.");
+    err.offline = true;  // sin red: quien llama puede reintentar más tarde
+    throw err;
   }
 
   try{ data = await res.json(); }catch{ data = {}; }
@@ -72,12 +75,15 @@ async function api(path, { method="GET", body, auth=true, headers={} } = {}){
       // vuelve al login si estabas en página protegida
       location.replace("index.html");
     }
-    throw new Error(data?.error || "Sesión expirada.");
+    const err = new Error(data?.error || "Sesión expirada.");
+    err.status = 401;
+    throw err;
   }
 
   if (!res.ok || data?.ok === false){
-    const msg = data?.error || `Error HTTP ${res.status}`;
-    throw new Error(msg);
+    const err = new Error(data?.error || `Error HTTP ${res.status}`);
+    err.status = res.status;
+    throw err;
   }
   return data;
 }
@@ -103,6 +109,7 @@ async function register(){
       auth: false,
       body: { fullname, email, password, gender, age }
     });
+    clearLocalData();
     saveAuth(out.token, { id: out.id, email: out.email, fullname: out.fullname, role: out.role });
     setMsg(msgId, "Registro exitoso. Redirigiendo…", true);
     setTimeout(() => location.replace("index.html"), 400);
@@ -128,6 +135,8 @@ async function login(){
       auth: false,
       body: { email, password }
     });
+    // Otro alumno en el mismo equipo: no hereda lo que dejó el anterior
+    clearLocalData(out.id);
     saveAuth(out.token, { id: out.id, email: out.email, fullname: out.fullname, role: out.role });
     setMsg(msgId, "Ingreso correcto. Redirigiendo…", true);
     setTimeout(() => redirectByRole(out.role), 300);
@@ -144,16 +153,53 @@ async function loadMe(){
     const el = document.getElementById("welcomeName");
     if (el) el.textContent = me.fullname || "";
     return me;
-  }catch{
+  }catch(e){
+    // Sin red se sigue con la sesión guardada (la encuesta funciona offline)
+    if (e.offline && getToken()){
+      const u = getUser();
+      const el = document.getElementById("welcomeName");
+      if (el) el.textContent = u.fullname || "";
+      return u.role ? u : null;
+    }
     clearAuth();
     return null;
   }
 }
+// Datos del alumno que la encuesta offline deja en el navegador (student.html):
+// respuestas en curso, envíos pendientes y versión de la encuesta. En
+// computadores compartidos del colegio no deben quedar para el siguiente.
+const LOCAL_DATA_PREFIXES = ["scas_progress_", "scas_outbox_", "scas_def_version_"];
+
+function clearLocalData(keepUserId){
+  // keepUserId: conserva lo del alumno que vuelve a entrar (p. ej. tras vencer el token)
+  const keep = keepUserId == null ? null : `_${keepUserId}`;
+  for (const k of Object.keys(localStorage)){
+    if (!LOCAL_DATA_PREFIXES.some(p => k.startsWith(p))) continue;
+    if (keep && k.endsWith(keep)) continue;
+    localStorage.removeItem(k);
+  }
+  if (!keep) sessionStorage.removeItem("scasResult");
+}
+function hasPendingSubmits(){
+  return Object.keys(localStorage).some(k => k.startsWith("scas_outbox_"));
+}
+
 function logout(){
+  if (hasPendingSubmits() &&
+      !confirm("Hay respuestas sin enviar en este equipo. Si cierras sesión se borrarán. ¿Salir igual?")){
+    return;
+  }
+  clearLocalData();
   clearAuth();
   location.replace("index.html");
 }
 
+/* =================== Service worker =================== */
+function registerServiceWorker(){
+  if (!("serviceWorker" in navigator)) return;
+  navigator.serviceWorker.register("sw.js").catch(e => console.warn("Service worker:", e));
+}
+
 /* =================== Protección de páginas =================== */
 async function requireAuthPage(requiredRole){
   const me = await loadMe();
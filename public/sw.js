@@ -0,0 +1,74 @@
+/* public/sw.js
+   Service worker de la encuesta del alumno (lo registra student.html).
+   - Definición SCAS: /api/survey/scas?v=<versión> se sirve desde la caché.
+     La versión es el ETag del servidor (GET /api/survey/scas/version), así
+     que una URL nueva solo aparece cuando cambia la encuesta.
+   - Páginas y archivos: red primero, copia en caché para abrir sin conexión.
+   - /auth y el resto de /api van directo a la red (los envíos los encola la
+     página en localStorage, ver student.html).
+   Se sirve con Cache-Control: no-cache (app/assets.py) para que los cambios
+   lleguen al siguiente ingreso.
+*/
+
+const SHELL_CACHE  = "scas-shell-v1";
+const SURVEY_CACHE = "scas-survey-v1";
+const SURVEY_KEEP  = 3;   // versiones de la encuesta que se conservan
+
+self.addEventListener("install", () => self.skipWaiting());
+
+self.addEventListener("activate", (e) => {
+  e.waitUntil((async () => {
+    const keep = [SHELL_CACHE, SURVEY_CACHE];
+    for (const name of await caches.keys()){
+      if (!keep.includes(name)) await caches.delete(name);
+    }
+    await self.clients.claim();
+  })());
+});
+
+self.addEventListener("fetch", (e) => {
+  const req = e.request;
+  if (req.method !== "GET") return;
+  const url = new URL(req.url);
+
+  // La API puede estar en otro origen (GitHub Pages + backend aparte)
+  if (url.pathname.endsWith("/api/survey/scas") && url.searchParams.has("v")){
+    e.respondWith(surveyDefinition(req, url));
+    return;
+  }
+  if (url.origin !== self.location.origin) return;
+  if (url.pathname.startsWith("/api/") || url.pathname.startsWith("/auth/")) return;
+  e.respondWith(networkFirst(req));
+});
+
+/* Definición por versión: inmutable, caché primero */
+async function surveyDefinition(req, url){
+  const cache = await caches.open(SURVEY_CACHE);
+  const key = url.href;  // sin Authorization: la versión ya identifica el contenido
+  const hit = await cache.match(key);
+  if (hit) return hit;
+
+  const res = await fetch(req);
+  if (res.ok){
+    await cache.put(key, res.clone());
+    const keys = await cache.keys();  // en orden de inserción
+    for (const old of keys.slice(0, Math.max(0, keys.length - SURVEY_KEEP))){
+      await cache.delete(old);
+    }
+  }
+  return res;
+}
+
+/* Páginas y estáticos: red primero; sin red, la última copia */
+async function networkFirst(req){
+  const cache = await caches.open(SHELL_CACHE);
+  try{
+    const res = await fetch(req);
+    if (res.ok) cache.put(req, res.clone());
+    return res;
+  }catch(err){
+    const hit = await cache.match(req, { ignoreSearch: true });
+    if (hit) return hit;
+    throw err;
+  }
+}
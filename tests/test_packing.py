@@ -0,0 +1,85 @@
+# tests/test_packing.py
+"""
+Empaquetado de respuestas a 2 bits y máscara de ítems respondidos
+(user-031): lo que se guarda en answers_packed/answers_mask en lugar de
+las 44 filas de response_items tiene que volver idéntico.
+"""
+import numpy as np
+import pytest
+
+from app import packing
+from app.packing import N_ITEMS
+
+
+def test_round_trip_all_values():
+    values = [n % 4 for n in range(N_ITEMS)]
+    blob = packing.encode_answers(values)
+    assert len(blob) == packing.PACKED_BYTES
+    assert packing.decode_answers(blob).tolist() == values
+
+
+def test_bit_layout_item_one_in_high_bits():
+    values = [0] * N_ITEMS
+    values[0], values[3], values[43] = 3, 1, 2
+    blob = packing.encode_answers(values)
+    assert blob[0] == 0b11000001
+    assert blob[-1] == 0b00000010
+
+
+def test_decode_many_matches_single_decode():
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, 4, size=(5, N_ITEMS))
+    blobs = [packing.encode_answers(r) for r in rows]
+    assert (packing.decode_many(blobs) == rows).all()
+    assert packing.decode_many([]).shape == (0, N_ITEMS)
+
+
+@pytest.mark.parametrize("values", [[0] * (N_ITEMS - 1), [4] + [0] * (N_ITEMS - 1)])
+def test_encode_rejects_bad_input(values):
+    with pytest.raises(ValueError):
+        packing.encode_answers(values)
+
+
+def test_decode_rejects_truncated_blob():
+    with pytest.raises(ValueError):
+        packing.decode_many([b"\x00" * (packing.PACKED_BYTES - 1)])
+
+
+def test_complete_attempt_has_no_mask():
+    answers = {n: 3 for n in range(1, N_ITEMS + 1)}
+    blob, mask = packing.encode_by_number(answers)
+    assert mask is None
+    assert packing.decode_mask(mask).all()
+    assert packing.decode_answers(blob).tolist() == [3] * N_ITEMS
+
+
+def test_missing_items_are_kept_apart_from_zero():
+    # Ítem 2 respondido "Nunca" (0), ítems 5 y 44 sin responder
+    answers = {n: 1 for n in range(1, N_ITEMS + 1) if n not in (5, 44)}
+    answers[2] = 0
+    blob, mask = packing.encode_by_number(answers)
+    assert len(mask) == packing.MASK_BYTES
+
+    answered = packing.decode_mask(mask)
+    values = packing.decode_answers(blob)
+    assert not answered[4] and not answered[43]
+    assert answered[1] and values[1] == 0
+    assert answered.sum() == N_ITEMS - 2
+    assert {n + 1: int(values[n]) for n in np.flatnonzero(answered)} == answers
+
+
+def test_out_of_range_item_numbers_are_ignored():
+    answers = {n: 2 for n in range(1, N_ITEMS + 1)}
+    blob, mask = packing.encode_by_number({**answers, 0: 3, N_ITEMS + 1: 3})
+    assert mask is None
+    assert packing.decode_answers(blob).tolist() == [2] * N_ITEMS
+
+
+def test_pack_normalized_maps_item_ids_to_numbers():
+    items = {100 + n: {"item_number": n} for n in range(1, N_ITEMS + 1)}
+    normalized = [(100 + n, n % 4) for n in range(1, N_ITEMS + 1) if n != 7]
+    normalized.append((999, 3))  # ítem que no es de la encuesta
+    blob, mask = packing.pack_normalized(normalized, items)
+    answered = packing.decode_mask(mask)
+    assert answered.tolist() == [n != 7 for n in range(1, N_ITEMS + 1)]
+    assert packing.decode_answers(blob)[0] == 1
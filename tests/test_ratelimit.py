@@ -0,0 +1,152 @@
+# tests/test_ratelimit.py
+"""
+Control de admisión (user-032): recarga y rechazo del token bucket, paso a
+buckets en memoria cuando Redis falla y respuestas 429/503 del decorador.
+El reloj se controla a mano; no hace falta Redis.
+"""
+import pytest
+from flask import Flask
+
+from app import ratelimit
+from app.ratelimit import MemoryBackend, RedisBackend, parse_rate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", c)
+    return c
+
+
+def test_parse_rate():
+    assert parse_rate("10/60") == (10 / 60, 10)
+    assert parse_rate("5") == (5, 5)
+    assert parse_rate("0") is None
+    assert parse_rate("") is None
+
+
+# -------- token bucket --------
+def test_burst_then_deny_with_wait(clock):
+    b = MemoryBackend()
+    rate, burst = parse_rate("3/30")  # 1 token cada 10 s
+    assert [b.take("k", rate, burst) for _ in range(3)] == [0, 0, 0]
+    assert b.take("k", rate, burst) == pytest.approx(10)
+
+
+def test_refill_over_time(clock):
+    b = MemoryBackend()
+    rate, burst = parse_rate("3/30")
+    for _ in range(3):
+        b.take("k", rate, burst)
+    clock.now += 4
+    assert b.take("k", rate, burst) == pytest.approx(6)  # 0.4 tokens: faltan 6 s
+    clock.now += 6
+    assert b.take("k", rate, burst) == 0
+
+
+def test_refill_is_capped_at_burst(clock):
+    b = MemoryBackend()
+    rate, burst = parse_rate("2/10")
+    b.take("k", rate, burst)
+    clock.now += 3600
+    assert [b.take("k", rate, burst) for _ in range(3)] == [0, 0, pytest.approx(5)]
+
+
+def test_keys_are_independent_and_lru_bounded(clock):
+    b = MemoryBackend(max_buckets=2)
+    rate, burst = parse_rate("1/60")
+    assert b.take("a", rate, burst) == 0
+    assert b.take("b", rate, burst) == 0   # otra clave, su propio bucket
+    assert b.take("a", rate, burst) > 0    # "a" agotado y recién usado
+    b.take("c", rate, burst)               # desaloja "b", el menos usado
+    assert list(b._buckets) == ["a", "c"]
+    assert b.take("b", rate, burst) == 0   # vuelve con el bucket lleno
+
+
+# -------- Redis caído --------
+class FlakyScript:
+    def __init__(self):
+        self.calls = 0
+        self.fail = True
+
+    def __call__(self, keys, args):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("redis caído")
+        return "0"
+
+
+@pytest.fixture
+def redis_backend():
+    rb = RedisBackend.__new__(RedisBackend)  # sin conectar: el script se reemplaza
+    rb._errors = (OSError,)
+    rb._take = FlakyScript()
+    rb._fallback = MemoryBackend()
+    rb._down_until = 0.0
+    return rb
+
+
+def test_redis_error_falls_back_to_memory(clock, redis_backend):
+    rate, burst = parse_rate("1/60")
+    assert redis_backend.take("k", rate, burst) == 0
+    assert redis_backend.take("k", rate, burst) > 0  # el bucket en memoria sigue limitando
+    assert redis_backend._take.calls == 1            # no se reintenta Redis en cada request
+
+
+def test_redis_is_retried_after_backoff(clock, redis_backend):
+    rate, burst = parse_rate("10/60")
+    redis_backend.take("k", rate, burst)
+    redis_backend._take.fail = False
+    clock.now += RedisBackend.RETRY_SECONDS + 1
+    assert redis_backend.take("k", rate, burst) == 0
+    assert redis_backend._take.calls == 2
+
+
+# -------- decorador --------
+@pytest.fixture
+def client(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, "backend", MemoryBackend())
+    app = Flask(__name__)
+    state = {"email": "a@gmail.com", "gate": None}
+
+    @app.post("/login")
+    @ratelimit.limit("test_login", ip="100/60", account="2/60",
+                     account_key=lambda: state["email"])
+    def login():
+        return {"ok": True}
+
+    @app.post("/busy")
+    @ratelimit.limit("test_busy", concurrency=1)
+    def busy():
+        # Mientras este request está dentro, otro no cabe
+        inner = app.test_client().post("/busy")
+        return {"inner": inner.status_code}
+
+    c = app.test_client()
+    c.state = state
+    return c
+
+
+def test_account_limit_answers_429_with_retry_after(client):
+    assert client.post("/login").status_code == 200
+    assert client.post("/login").status_code == 200
+    r = client.post("/login")
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "30"
+
+    client.state["email"] = "b@gmail.com"  # otra cuenta desde la misma IP
+    assert client.post("/login").status_code == 200
+
+
+def test_concurrency_cap_sheds_with_503(client):
+    r = client.post("/busy")
+    assert r.status_code == 200
+    assert r.get_json()["inner"] == 503
@@ -0,0 +1,201 @@
+# tests/test_survey_offline.py
+"""
+Cliente offline de la encuesta (user-044): definición versionada con ETag/304
+e idempotencia de envíos reintentados por client_ref.
+
+La base se reemplaza por un almacén en memoria que respeta el índice único
+(user_id, client_ref) de responses; no hace falta MySQL.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+
+from app import survey
+from app.utils import make_token
+
+N_ITEMS = 44
+
+
+class FakeDB:
+    """Lo justo de responses/response_items para scas_submit y scas_def."""
+
+    def __init__(self):
+        self.responses = []
+        self.items = []
+        self.lookup_misses = 0   # veces que _BY_CLIENT_REF "no ve" una fila (carrera)
+
+    def one(self, q, params=None, **_):
+        if q is survey._SURVEY:
+            return {"id": 1, "code": "SCAS_CHILD", "name": "SCAS"}
+        if q is survey._LAST_ATTEMPT:
+            rows = [r for r in self.responses if r["user_id"] == params["u"]]
+            return max(rows, key=lambda r: r["id"]) if rows else None
+        if q is survey._BY_CLIENT_REF:
+            if self.lookup_misses:
+                self.lookup_misses -= 1
+                return None
+            for r in self.responses:
+                if r["user_id"] == params["u"] and r["client_ref"] == params["c"]:
+                    return {"id": r["id"]}
+            return None
+        raise AssertionError(f"consulta inesperada: {q!r}")
+
+    def all(self, q, params=None, **_):
+        if q is survey._ITEM_META:
+            return [{"id": n, "item_number": n, "is_scored": 1, "subscale": "GAD"}
+                    for n in range(1, N_ITEMS + 1)]
+        if q is survey._ITEMS:
+            return [{"id": n, "item_number": n, "prompt": f"Ítem {n}", "is_scored": 1,
+                     "subscale": "GAD"} for n in range(1, N_ITEMS + 1)]
+        raise AssertionError(f"consulta inesperada: {q!r}")
+
+    def exec(self, q, params=None):
+        if q is survey._INSERT_RESPONSE:
+            ref = params["cr"]
+            if ref and any(r["user_id"] == params["u"] and r["client_ref"] == ref
+                           for r in self.responses):
+                raise IntegrityError("INSERT INTO responses", params, Exception("Duplicate entry"))
+            self.responses.append({"id": len(self.responses) + 1, "user_id": params["u"],
+                                   "client_ref": ref, "created_at": datetime.utcnow()})
+            return 1
+        if q is survey._INSERT_ITEMS:
+            self.items.extend(params)
+            return len(params)
+        raise AssertionError(f"sentencia inesperada: {q!r}")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    after = []
+    monkeypatch.setattr(survey, "db_one", fake.one)
+    monkeypatch.setattr(survey, "db_all", fake.all)
+    monkeypatch.setattr(survey, "db_exec", fake.exec)
+    monkeypatch.setattr(survey, "current_user", lambda claims: {
+        "id": claims["id"], "tenant_id": 1, "fullname": "Alumno", "email": "a@gmail.com"})
+    monkeypatch.setattr(survey, "run_cpu", lambda fn, features: {"label": "Bajo"})
+    monkeypatch.setattr(survey, "_after_submit", lambda *a, **k: after.append(a))
+    survey._META.clear()
+    survey._DEF.clear()
+    fake.after = after
+    return fake
+
+
+@pytest.fixture
+def client(db):
+    app = Flask(__name__)
+    app.register_blueprint(survey.bp)
+    return app.test_client()
+
+
+def _auth(uid):
+    return {"Authorization": "Bearer " + make_token({"id": uid, "role": "student", "tid": 1})}
+
+
+def _answers():
+    return [{"item_id": n, "value": n % 4} for n in range(1, N_ITEMS + 1)]
+
+
+# -------- definición versionada --------
+def test_definition_has_etag_and_answers_304(client):
+    r = client.get("/api/survey/scas", headers=_auth(1))
+    assert r.status_code == 200
+    assert len(r.get_json()["items"]) == N_ITEMS
+    etag = r.headers["ETag"]
+
+    again = client.get("/api/survey/scas", headers={**_auth(1), "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+
+def test_version_matches_definition_etag(client):
+    etag = client.get("/api/survey/scas", headers=_auth(1)).headers["ETag"]
+    r = client.get("/api/survey/scas/version", headers=_auth(1))
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"] == "no-store"
+    assert f'"{r.get_json()["version"]}"' == etag
+
+
+def test_compressed_variant_has_its_own_etag(client):
+    plain = client.get("/api/survey/scas", headers=_auth(1)).headers["ETag"]
+    gz = client.get("/api/survey/scas", headers={**_auth(1), "Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert gz.headers["ETag"] != plain
+
+    # El ETag de una codificación no valida la otra
+    r = client.get("/api/survey/scas", headers={**_auth(1), "If-None-Match": plain,
+                                                 "Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    r = client.get("/api/survey/scas", headers={**_auth(1), "If-None-Match": gz.headers["ETag"],
+                                                 "Accept-Encoding": "gzip"})
+    assert r.status_code == 304
+
+
+def test_stale_etag_gets_full_body(client):
+    r = client.get("/api/survey/scas", headers={**_auth(1), "If-None-Match": '"otra-version"'})
+    assert r.status_code == 200
+    assert r.get_json()["items"]
+
+
+# -------- envíos idempotentes --------
+def test_retry_with_same_client_ref_is_not_duplicated(client, db):
+    body = {"answers": _answers(), "client_ref": "intento-0001"}
+    first = client.post("/api/survey/scas/submit", json=body, headers=_auth(10))
+    assert first.status_code == 200
+    assert first.get_json()["duplicate"] is False
+
+    # Un reintento mucho después (fuera de la ventana anti doble click)
+    db.responses[0]["created_at"] -= timedelta(hours=1)
+    retry = client.post("/api/survey/scas/submit", json=body, headers=_auth(10))
+    assert retry.status_code == 200
+    assert retry.get_json()["duplicate"] is True
+    assert retry.get_json()["response_id"] == first.get_json()["response_id"]
+    assert len(db.responses) == 1
+    assert len(db.items) == N_ITEMS
+    assert len(db.after) == 1
+
+
+def test_new_client_ref_stores_new_attempt(client, db):
+    client.post("/api/survey/scas/submit", json={"answers": _answers(), "client_ref": "intento-0001"},
+                headers=_auth(11))
+    db.responses[0]["created_at"] -= timedelta(hours=1)
+    r = client.post("/api/survey/scas/submit", json={"answers": _answers(), "client_ref": "intento-0002"},
+                    headers=_auth(11))
+    assert r.get_json()["duplicate"] is False
+    assert len(db.responses) == 2
+
+
+def test_concurrent_retry_hits_unique_index(client, db):
+    """Dos reintentos a la vez: el segundo no ve la fila, choca con el índice y la reutiliza."""
+    body = {"answers": _answers(), "client_ref": "intento-0003"}
+    first = client.post("/api/survey/scas/submit", json=body, headers=_auth(12))
+    db.responses[0]["created_at"] -= timedelta(hours=1)
+
+    db.lookup_misses = 1  # la consulta previa llega antes de que el otro confirme
+    racing = client.post("/api/survey/scas/submit", json=body, headers=_auth(12))
+    assert racing.status_code == 200
+    assert racing.get_json()["duplicate"] is True
+    assert racing.get_json()["response_id"] == first.get_json()["response_id"]
+    assert len(db.responses) == 1
+    assert len(db.items) == N_ITEMS  # el detalle no se vuelve a insertar
+    assert len(db.after) == 1        # ni se publican efectos dos veces
+
+
+def test_integrity_error_without_client_ref_is_not_swallowed(client, db, monkeypatch):
+    def boom(q, params=None):
+        raise IntegrityError("INSERT INTO responses", params, Exception("otra restricción"))
+
+    monkeypatch.setattr(survey, "db_exec", boom)
+    client.application.testing = True
+    with pytest.raises(IntegrityError):
+        client.post("/api/survey/scas/submit", json={"answers": _answers()}, headers=_auth(13))
+
+
+def test_invalid_client_ref_is_rejected(client, db):
+    r = client.post("/api/survey/scas/submit", json={"answers": _answers(), "client_ref": "a b"},
+                    headers=_auth(14))
+    assert r.status_code == 400
+    assert db.responses == []